@@ -0,0 +1,295 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#    MA  02110-1301, USA.
+"""
+Benchmarks the MS, gridder and plot apps on synthetic data.
+
+    python -m benchmarks.run --scale small --output bench.json
+    python -m benchmarks.run --scale small --compare bench.json
+
+Each case is timed over --repeat runs, reporting the median and minimum
+wall time and the throughput of the median run. Peak memory is measured
+in a separate run with tracemalloc, which sees numpy allocations but not
+those made inside ducc0 or casacore. With --compare, cases slower than the
+baseline by more than --tolerance are reported and the exit status is 1.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.synthetic import make_ms, make_visibilities
+
+# rows, chans, pols, npix
+SCALES = {
+    "tiny": dict(rows=64, chans=4, pols=4, npix=32),
+    "small": dict(rows=10000, chans=16, pols=4, npix=256),
+    "medium": dict(rows=100000, chans=64, pols=4, npix=1024),
+    "large": dict(rows=1000000, chans=128, pols=4, npix=4096),
+}
+
+
+@dataclass
+class Case:
+    # returns the function to time, called once per run
+    setup: Callable[[dict, str], Callable[[], None]]
+    # work items of a run, e.g. visibilities or bytes, and their unit
+    items: Callable[[dict], int]
+    unit: str
+
+
+CASES: Dict[str, Case] = {}
+
+
+def case(name, items, unit):
+    def register(setup):
+        CASES[name] = Case(setup, items, unit)
+        return setup
+    return register
+
+
+def _visibility_count(params):
+    return params["rows"] * params["chans"] * params["pols"]
+
+
+def _array_drop(name, array):
+    from dlg.drop import InMemoryDROP
+    from daliuge_component_nifty.ms import numpy_to_drop
+    drop = InMemoryDROP(name, name)
+    numpy_to_drop(array, drop)
+    return drop
+
+
+def _run_app(app, inputs, num_outputs):
+    from dlg.drop import InMemoryDROP
+    for drop in inputs:
+        app.addInput(drop)
+    for i in range(num_outputs):
+        app.addOutput(InMemoryDROP(f"out{i}", f"out{i}"))
+    return app.run
+
+
+@case("numpy_to_drop", lambda p: _visibility_count(p) * 16, "bytes")
+def _numpy_to_drop(params, workdir):
+    from dlg.drop import InMemoryDROP
+    from daliuge_component_nifty.ms import numpy_to_drop
+    vis = make_visibilities(params["rows"], params["chans"], params["pols"], params["npix"]).vis
+    return lambda: numpy_to_drop(vis, InMemoryDROP("vis", "vis"))
+
+
+@case("drop_to_numpy_memory", lambda p: _visibility_count(p) * 16, "bytes")
+def _drop_to_numpy_memory(params, workdir):
+    from daliuge_component_nifty.ms import drop_to_numpy
+    drop = _array_drop("vis", make_visibilities(params["rows"], params["chans"], params["pols"], params["npix"]).vis)
+    # writable forces the copy a consumer modifying its input pays
+    return lambda: drop_to_numpy(drop, writable=True)
+
+
+@case("drop_to_numpy_file", lambda p: _visibility_count(p) * 16, "bytes")
+def _drop_to_numpy_file(params, workdir):
+    from dlg.drop import FileDROP
+    from daliuge_component_nifty.ms import drop_to_numpy, numpy_to_drop
+    drop = FileDROP("vis", "vis", filepath=os.path.join(workdir, "vis.npy"))
+    numpy_to_drop(make_visibilities(params["rows"], params["chans"], params["pols"], params["npix"]).vis, drop)
+    drop.setCompleted()
+    # sum touches every page of the memory map
+    return lambda: drop_to_numpy(drop).sum()
+
+
+@case("MSReadApp", _visibility_count, "vis")
+def _ms_read(params, workdir):
+    from dlg.drop import FileDROP
+    from daliuge_component_nifty.ms import MSReadApp
+    path = os.path.join(workdir, "bench.ms")
+    if not os.path.exists(path):
+        make_ms(path, params["rows"], params["chans"], params["pols"], params["npix"])
+    return _run_app(MSReadApp("read", "read"), [FileDROP("ms", "ms", filepath=path)], 6)
+
+
+@case("MS2DirtyApp", lambda p: p["rows"] * p["chans"], "vis")
+def _ms2dirty(params, workdir):
+    from daliuge_component_nifty.cpu_gridder import MS2DirtyApp
+    data = make_visibilities(params["rows"], params["chans"], 0, params["npix"])
+    inputs = [_array_drop(name, getattr(data, name)) for name in ("uvw", "freq", "vis", "weight_spectrum")]
+    app = MS2DirtyApp("ms2dirty", "ms2dirty", npix_x=params["npix"], npix_y=params["npix"], nthreads=params["nthreads"])
+    return _run_app(app, inputs, 1)
+
+
+@case("PrefetchMS2DirtyApp", lambda p: p["rows"] * p["chans"], "vis")
+def _prefetch_ms2dirty(params, workdir):
+    from dlg.drop import FileDROP
+    from daliuge_component_nifty.cpu_gridder import PrefetchMS2DirtyApp
+    path = os.path.join(workdir, "bench.ms")
+    if not os.path.exists(path):
+        make_ms(path, params["rows"], params["chans"], params["pols"], params["npix"])
+    app = PrefetchMS2DirtyApp("prefetch", "prefetch", npix_x=params["npix"], npix_y=params["npix"],
+                              nthreads=params["nthreads"])
+    return _run_app(app, [FileDROP("ms", "ms", filepath=path)], 1)
+
+
+@case("Dirty2MSApp", lambda p: p["rows"] * p["chans"], "vis")
+def _dirty2ms(params, workdir):
+    from daliuge_component_nifty.cpu_gridder import Dirty2MSApp
+    data = make_visibilities(params["rows"], params["chans"], 0, params["npix"])
+    dirty = np.random.default_rng(0).normal(size=(params["npix"], params["npix"]))
+    inputs = [_array_drop(name, array) for name, array in
+              (("uvw", data.uvw), ("freq", data.freq), ("dirty", dirty), ("weight_spectrum", data.weight_spectrum))]
+    app = Dirty2MSApp("dirty2ms", "dirty2ms", nthreads=params["nthreads"])
+    return _run_app(app, inputs, 1)
+
+
+@case("ImagePlotApp", lambda p: p["npix"] ** 2, "pixels")
+def _image_plot(params, workdir):
+    import matplotlib
+    matplotlib.use("Agg")
+    from daliuge_component_nifty.plot import ImagePlotApp
+    image = np.random.default_rng(0).normal(size=(params["npix"], params["npix"]))
+    return _run_app(ImagePlotApp("plot", "plot"), [_array_drop("image", image)], 1)
+
+
+def measure(name: str, params: dict, repeat: int, workdir: str) -> dict:
+    bench = CASES[name]
+    times = []
+    for _ in range(repeat):
+        run = bench.setup(params, workdir)
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        del run
+
+    run = bench.setup(params, workdir)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    wall = statistics.median(times)
+    items = bench.items(params)
+    return {
+        "wall_s": wall,
+        "wall_s_min": min(times),
+        "repeat": repeat,
+        "items": items,
+        "unit": bench.unit,
+        "throughput": items / wall if wall > 0 else None,
+        "peak_traced_bytes": peak,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(params: dict, cases: List[str], repeat: int) -> dict:
+    results = {}
+    # casacore reports table opens on stdout, keep it for the report
+    with tempfile.TemporaryDirectory(prefix="nifty-bench-") as workdir, \
+            contextlib.redirect_stdout(sys.stderr):
+        for name in cases:
+            results[name] = measure(name, params, repeat, workdir)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "params": params,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Returns a line for every case whose median wall time grew by more than
+    tolerance, as a fraction, relative to the baseline report.
+    """
+    regressions = []
+    if report["meta"]["params"] != baseline["meta"]["params"]:
+        regressions.append(f"params differ from baseline: {baseline['meta']['params']}")
+        return regressions
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        ratio = result["wall_s"] / baseline["results"][name]["wall_s"]
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {ratio:.2f}x baseline wall time")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--rows", type=int)
+    parser.add_argument("--chans", type=int)
+    parser.add_argument("--pols", type=int, choices=[1, 2, 4])
+    parser.add_argument("--npix", type=int)
+    parser.add_argument("--nthreads", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    params = dict(SCALES[args.scale], nthreads=args.nthreads)
+    for key in ("rows", "chans", "pols", "npix"):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    report = run_benchmarks(params, args.cases, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#    MA  02110-1301, USA.
+"""
+Synthetic visibilities and measurement sets of arbitrary size for benchmarks.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+SPEED_OF_LIGHT = 299792458.0
+# XX, (XY, YX,) YY by number of pols
+LINEAR_CORR_TYPES = {1: [9], 2: [9, 12], 4: [9, 10, 11, 12]}
+
+
+@dataclass
+class Visibilities:
+    uvw: np.ndarray
+    freq: np.ndarray
+    vis: np.ndarray
+    weight_spectrum: np.ndarray
+    flag: np.ndarray
+
+
+def make_freq(num_chan: int) -> np.ndarray:
+    return np.linspace(1e8, 2e8, num_chan)
+
+
+def make_uvw(num_rows: int, npix: int, freq: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Baselines in metres whose uv coordinates stay within the band
+    limit of an npix image at the default pixel size of 1 / npix, with small
+    w terms.
+    """
+    uv_max = 0.4 * npix * SPEED_OF_LIGHT / freq.max()
+    uvw = rng.uniform(-uv_max, uv_max, size=(num_rows, 3))
+    uvw[:, 2] *= 0.01
+    return uvw
+
+
+def make_visibilities(num_rows: int, num_chan: int, num_pol: int, npix: int,
+                      seed: int = 0, flag_fraction: float = 0.1) -> Visibilities:
+    """
+    Random visibilities of shape (rows, chans, pols), or (rows, chans) if
+    num_pol is 0, as consumed by the gridder apps.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (num_rows, num_chan) + ((num_pol,) if num_pol else ())
+    freq = make_freq(num_chan)
+    return Visibilities(
+        uvw=make_uvw(num_rows, npix, freq, rng),
+        freq=freq,
+        vis=rng.normal(size=shape) + 1j * rng.normal(size=shape),
+        weight_spectrum=rng.uniform(size=shape),
+        flag=rng.uniform(size=shape) < flag_fraction,
+    )
+
+
+def make_ms(path: str, num_rows: int, num_chan: int, num_pol: int, npix: int,
+            seed: int = 0, chunk_rows: int = 100000) -> str:
+    """
+    Writes a measurement set with DATA, WEIGHT_SPECTRUM, FLAG, WEIGHT, UVW
+    and antennas filled in, plus the SPECTRAL_WINDOW and POLARIZATION rows
+    MSReadApp needs. Rows are generated chunk_rows at a time so large sets
+    can be written with bounded memory.
+    """
+    import casacore.tables
+
+    desc = casacore.tables.maketabdesc([
+        casacore.tables.makearrcoldesc("DATA", 0j, shape=[num_chan, num_pol]),
+        casacore.tables.makearrcoldesc("WEIGHT_SPECTRUM", 0.0, shape=[num_chan, num_pol]),
+    ])
+    msm = casacore.tables.default_ms(path, desc)
+    msm.addrows(num_rows)
+    num_antennas = max(2, int(np.sqrt(2 * num_rows)))
+    for start in range(0, num_rows, chunk_rows):
+        nrow = min(chunk_rows, num_rows - start)
+        data = make_visibilities(nrow, num_chan, num_pol, npix, seed=seed + start)
+        rows = np.arange(start, start + nrow)
+        msm.putcol("UVW", data.uvw, startrow=start, nrow=nrow)
+        msm.putcol("ANTENNA1", rows % num_antennas, startrow=start, nrow=nrow)
+        msm.putcol("ANTENNA2", (rows // num_antennas) % num_antennas, startrow=start, nrow=nrow)
+        msm.putcol("DATA", data.vis.astype(np.complex64), startrow=start, nrow=nrow)
+        msm.putcol("WEIGHT_SPECTRUM", data.weight_spectrum, startrow=start, nrow=nrow)
+        msm.putcol("FLAG", data.flag, startrow=start, nrow=nrow)
+        msm.putcol("WEIGHT", data.weight_spectrum.mean(axis=1), startrow=start, nrow=nrow)
+
+    mssw = casacore.tables.table(msm.getkeyword("SPECTRAL_WINDOW"), readonly=False, ack=False)
+    mssw.addrows(1)
+    mssw.putcell("CHAN_FREQ", 0, make_freq(num_chan))
+    mssw.close()
+    mspol = casacore.tables.table(msm.getkeyword("POLARIZATION"), readonly=False, ack=False)
+    mspol.addrows(1)
+    mspol.putcell("NUM_CORR", 0, num_pol)
+    mspol.putcell("CORR_TYPE", 0, np.array(LINEAR_CORR_TYPES[num_pol]))
+    mspol.close()
+    msm.close()
+    return path
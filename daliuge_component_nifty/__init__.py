@@ -1,10 +1,32 @@
 __package__ = "daliuge_component_nifty"
 # The following imports are the binding to the DALiuGE system
 from dlg import droputils, utils
+import importlib
 
 # extend the following as required
-#from .cpu_gridder import MS2DirtyApp
-from .cpu_gridder import MS2DirtyApp, Dirty2MSApp
-from .cuda_gridder import CudaMS2DirtyApp, CudaDirty2MSApp
+# apps are imported from their module on first access so that importing the
+# package does not load ducc0, wagg, casacore or matplotlib
+_APP_MODULES = {
+    "MS2DirtyApp": ".cpu_gridder",
+    "StreamingMS2DirtyApp": ".cpu_gridder",
+    "PrefetchMS2DirtyApp": ".cpu_gridder",
+    "Dirty2MSApp": ".cpu_gridder",
+    "CudaMS2DirtyApp": ".cuda_gridder",
+    "CudaDirty2MSApp": ".cuda_gridder",
+    "ReduceImagesApp": ".reduce",
+}
 
-__all__ = ["MS2DirtyApp", "Dirty2MSApp", "CudaMS2DirtyApp", "CudaDirty2MSApp"]
+__all__ = ["MS2DirtyApp", "StreamingMS2DirtyApp", "PrefetchMS2DirtyApp", "Dirty2MSApp", "CudaMS2DirtyApp",
+           "CudaDirty2MSApp", "ReduceImagesApp"]
+
+
+def __getattr__(name):
+    if name not in _APP_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_APP_MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
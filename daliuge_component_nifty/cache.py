@@ -0,0 +1,186 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#    MA  02110-1301, USA.
+"""
+On disk, content addressed cache of app results.
+
+Entries are .npy files in a directory named by the hex digest of their key,
+which covers an app's class, its parameters and, for results computed from
+arrays, the contents of those arrays. Any number of processes, including
+ones on other nodes sharing the filesystem, may use a cache directory at
+once: entries are written to a private temporary file and renamed into
+place, so readers only ever see complete entries, and writers racing on a
+key write the same content. Loading an entry refreshes its modification
+time, and once the entries exceed the cache's size limit the least recently
+used ones are removed. An entry removed while memory mapped stays readable
+until unmapped.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from daliuge_component_nifty.metrics import phase
+from daliuge_component_nifty.wire import c_order_chunks
+from dlg.meta import (dlg_bool_param, dlg_dict_param, dlg_enum_param, dlg_float_param,
+                      dlg_int_param, dlg_list_param, dlg_string_param)
+
+logger = logging.getLogger(__name__)
+
+# bump to invalidate existing entries when the layout of results changes
+CACHE_VERSION = 1
+HASH_CHUNK_SIZE = 16 * 1024 * 1024
+ENTRY_SUFFIX = ".npy"
+
+# parameters that do not change an app's results
+CACHE_EXCLUDE_PARAMS = ("cache_dir", "cache_max_bytes", "nthreads")
+
+_PARAM_TYPES = (dlg_bool_param, dlg_int_param, dlg_float_param, dlg_string_param,
+                dlg_enum_param, dlg_list_param, dlg_dict_param)
+
+
+def app_params(app, exclude: Iterable[str] = CACHE_EXCLUDE_PARAMS) -> dict:
+    """
+    Returns the current values of the dlg_*_param attributes declared by the
+    class of app and its bases.
+    """
+    exclude = set(exclude)
+    params = {}
+    for cls in reversed(type(app).__mro__):
+        for name, value in vars(cls).items():
+            if isinstance(value, _PARAM_TYPES) and name not in exclude:
+                params[name] = getattr(app, name)
+    return params
+
+
+def hash_array(hasher, array: np.ndarray):
+    """
+    Adds the dtype, shape and C order contents of array to hasher.
+    """
+    array = np.asarray(array)
+    hasher.update(f"{array.dtype.str}{array.shape}".encode())
+    for chunk in c_order_chunks(array, HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+
+
+def cache_key(app, arrays: Iterable[np.ndarray] = (), exclude: Iterable[str] = CACHE_EXCLUDE_PARAMS,
+              **fields) -> str:
+    """
+    Returns the key of the result of app computed from arrays, with any
+    further fields that identify its inputs. Parameters named in exclude
+    are left out of the key.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    description = dict(fields, version=CACHE_VERSION,
+                       app=f"{type(app).__module__}.{type(app).__qualname__}", params=app_params(app, exclude))
+    hasher.update(json.dumps(description, sort_keys=True, default=str).encode())
+    for array in arrays:
+        hash_array(hasher, array)
+    return hasher.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def load(self, key: str) -> Optional[np.ndarray]:
+        """
+        Returns the entry for key memory mapped read only, or None.
+        """
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # evicted meanwhile, the mapping stays valid
+            pass
+        return array
+
+    def store(self, key: str, array: np.ndarray):
+        fd, tmp = tempfile.mkstemp(prefix=f".{key}.", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.asarray(array), allow_pickle=False)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the entries in the
+        directory take at most max_bytes.
+        """
+        if self.max_bytes is None:
+            return
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(ENTRY_SUFFIX) and not entry.name.startswith("."):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # evicted by another process
+                pass
+            total -= size
+
+
+def cached_result(app, arrays: Iterable[np.ndarray], compute: Callable[[], np.ndarray]) -> np.ndarray:
+    """
+    Returns the result of compute() for app's input arrays, loaded from the
+    app's cache_dir if present there and stored in it otherwise. Without a
+    cache_dir compute() is called directly.
+    """
+    if not getattr(app, "cache_dir", None):
+        return compute()
+    cache = ResultCache(app.cache_dir, app.cache_max_bytes)
+    with phase("cache"):
+        key = cache_key(app, arrays)
+        result = cache.load(key)
+    if result is not None:
+        logger.debug("%s result loaded from cache entry %s", app.uid, key)
+        return result
+    result = compute()
+    with phase("cache"):
+        cache.store(key, result)
+    return result
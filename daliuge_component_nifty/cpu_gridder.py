@@ -19,17 +19,90 @@
 #    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #    MA  02110-1301, USA.
 
+import concurrent.futures
+import functools
 import io
+import itertools
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
 import numpy as np
+# ducc0 is imported on first use so that importing the package stays cheap
 
-import ducc0
-from daliuge_component_nifty.ms import drop_to_numpy, numpy_to_drop
+from daliuge_component_nifty.cache import cached_result
+from daliuge_component_nifty.metrics import instrumented, phase
+from daliuge_component_nifty.ms import (NpyStreamReader, SharedArray, drop_to_numpy, live_rows, numpy_to_drop,
+                                        parallel_hands, pool_executor, precision_dtypes, prefetch_blocks, read_column_into,
+                                        stokes_i_vis, stokes_i_weight, tile_rows)
 from dlg.exceptions import DaliugeException
-from dlg.drop import BarrierAppDROP
+from dlg.ddap_protocol import AppDROPStates, DROPStates
+from dlg.drop import AppDROP, BarrierAppDROP
 from dlg.meta import (dlg_batch_input, dlg_batch_output, dlg_component,
                       dlg_float_param, dlg_int_param, dlg_streaming_input,
                       dlg_string_param, dlg_bool_param)
 
+logger = logging.getLogger(__name__)
+
+def num_threads(nthreads: int) -> int:
+    """
+    Returns the thread count to pass to ducc0, where 0 means all cores.
+    """
+    return nthreads if nthreads > 0 else os.cpu_count()
+
+
+def _ms2dirty_block(shared, chans, pol, kwargs):
+    """
+    Process pool task gridding the channels chans of polarisation pol
+    (None for 2D visibilities) from shared memory inputs.
+    """
+    shms, arrays = zip(*(shared_array.attach() for shared_array in shared))
+    try:
+        image = _ms2dirty_view(*arrays, chans, pol, kwargs)
+    finally:
+        del arrays
+        for shm in shms:
+            try:
+                shm.close()
+            except BufferError:
+                # still viewed from the traceback of an error, unmapped with it
+                pass
+    return pol, image
+
+
+def _ms2dirty_arrays(arrays, chans, pol, kwargs):
+    """
+    Thread pool task gridding the channels chans of polarisation pol
+    (None for 2D visibilities) straight from the input arrays.
+    """
+    return pol, _ms2dirty_view(*arrays, chans, pol, kwargs)
+
+
+def _sum_blocks(results, num_pols) -> np.ndarray:
+    """
+    Sums the (pol, image) results of the block tasks into one image, or
+    into a cube of num_pols images where pol is not None.
+    """
+    image = None
+    for pol, block_image in results:
+        if image is None:
+            shape = block_image.shape if pol is None else (num_pols,) + block_image.shape
+            image = np.zeros(shape, dtype=block_image.dtype)
+        if pol is None:
+            image += block_image
+        else:
+            image[pol] += block_image
+    return image
+
+
+def _ms2dirty_view(uvw, freq, vis, weight_spectrum, chans, pol, kwargs):
+    cells = (slice(None), chans) if pol is None else (slice(None), chans, pol)
+    weights = weight_spectrum[cells] if weight_spectrum.ndim == vis.ndim else weight_spectrum[:, chans]
+    import ducc0.wgridder
+    return ducc0.wgridder.ms2dirty(uvw, freq[chans], vis[cells], weights, **kwargs)
+
+
 ##
 # @brief MS2DirtyApp
 # @details CudaMS2DirtyApp
@@ -48,16 +121,30 @@ from dlg.meta import (dlg_batch_input, dlg_batch_output, dlg_component,
 #     \~English pixel horizontal angular size in radians
 # @param[in] param/pixsize_y pixsize_y//Float/readwrite/False/
 #     \~English pixel vertical angular size in radians
+# @param[in] param/epsilon epsilon/1e-6/Float/readwrite/False/
+#     \~English gridding accuracy, at least 1e-5 for single precision
+# @param[in] param/precision precision/double/String/readwrite/False/
+#     \~English single (float32/complex64) or double (float64/complex128) precision gridding
+# @param[in] param/nthreads nthreads/1/Integer/readwrite/False/
+#     \~English number of gridding threads, 0 for all cores
+# @param[in] param/chan_block_size chan_block_size//Integer/readwrite/False/
+#     \~English if set, grid blocks of this many channels concurrently in a process pool and sum them
+# @param[in] param/compact_rows compact_rows/False/Bool/readwrite/False/
+#     \~English drop rows whose weights are all zero before gridding
+# @param[in] param/cache_dir cache_dir//String/readwrite/False/
+#     \~English if set, directory of an on-disk result cache keyed by the inputs and parameters, shareable between workers
+# @param[in] param/cache_max_bytes cache_max_bytes//Integer/readwrite/False/
+#     \~English size limit of cache_dir, least recently used results are evicted beyond it
 # @param[in] port/uvw uvw/ndarray/
 #     \~English uvw port
 # @param[in] port/freq freq/ndarray/
 #     \~English freq port
 # @param[in] port/vis vis/ndarray/
-#     \~English vis port
+#     \~English vis port of shape (rows, chans) or (rows, chans, pols)
 # @param[in] port/weight_spectrum weight_spectrum/ndarray/
-#     \~English weight spectrum port
+#     \~English weight spectrum port of shape (rows, chans) or (rows, chans, pols)
 # @param[out] port/image image/ndarray/
-#     \~English dirty image port
+#     \~English dirty image port of shape (npix_x, npix_y), or (pols, npix_x, npix_y) for a vis cube
 # @par EAGLE_END
 class MS2DirtyApp(BarrierAppDROP):
     component_meta = dlg_component('MS2DirtyApp', 'Nifty Ms2Dirty App.',
@@ -69,26 +156,472 @@ class MS2DirtyApp(BarrierAppDROP):
     do_wstacking = dlg_bool_param('do_wstacking', True)
     pixsize_x = dlg_float_param('pixsize_x', None)
     pixsize_y = dlg_float_param('pixsize_y', None)
+    epsilon = dlg_float_param('epsilon', 1e-6)
+    precision = dlg_string_param('precision', 'double')
+    nthreads = dlg_int_param('nthreads', 1)
+    chan_block_size = dlg_int_param('chan_block_size', None)
+    compact_rows = dlg_bool_param('compact_rows', False)
+    cache_dir = dlg_string_param('cache_dir', None)
+    cache_max_bytes = dlg_int_param('cache_max_bytes', None)
 
+    @instrumented
     def run(self):
         if len(self.inputs) < 4:
             raise DaliugeException(f"CudaDirt2MsApp has {len(self.inputs)} input drops but requires at least 4")
+        real_dtype, complex_dtype = precision_dtypes(self.precision)
         uvw = drop_to_numpy(self.inputs[0])
         freq = drop_to_numpy(self.inputs[1])
-        vis = drop_to_numpy(self.inputs[2])
-        weight_spectrum = drop_to_numpy(self.inputs[3])
-        epsilon = 1e-6  # unused
+        vis = drop_to_numpy(self.inputs[2]).astype(complex_dtype, copy=False)
+        weight_spectrum = drop_to_numpy(self.inputs[3]).astype(real_dtype, copy=False)
+        image = cached_result(self, (uvw, freq, vis, weight_spectrum),
+                              lambda: self.makeImage(uvw, freq, vis, weight_spectrum))
+        numpy_to_drop(image, self.outputs[0])
+
+    def makeImage(self, uvw, freq, vis, weight_spectrum):
+        with phase("prepare"):
+            if self.compact_rows:
+                keep = live_rows(weight_spectrum)
+                if not keep.all():
+                    uvw, vis, weight_spectrum = uvw[keep], vis[keep], weight_spectrum[keep]
+
+            if self.pixsize_x == None:
+                self.pixsize_x = 1.0 / self.npix_x
+            if self.pixsize_y == None:
+                self.pixsize_y = 1.0 / self.npix_y
+
+        nthreads = num_threads(self.nthreads)
+        with phase("grid"):
+            if self.chan_block_size:
+                image = self.ms2dirtyChannelBlocks(uvw, freq, vis, weight_spectrum, nthreads)
+            elif vis.ndim == 3:
+                image = self.ms2dirtyCube(uvw, freq, vis, weight_spectrum, nthreads)
+            else:
+                image = self.ms2dirty(uvw, freq, vis, weight_spectrum, nthreads)
+        return image
+
+    def ms2dirty(self, uvw, freq, vis, weight_spectrum, nthreads):
+        import ducc0.wgridder
+        return ducc0.wgridder.ms2dirty(uvw, freq, vis, weight_spectrum,
+            npix_x=self.npix_x, npix_y=self.npix_y, pixsize_x=self.pixsize_x, pixsize_y=self.pixsize_y,
+            epsilon=self.epsilon, do_wstacking=self.do_wstacking, nthreads=nthreads)
+
+    def ms2dirtyChannelBlocks(self, uvw, freq, vis, weight_spectrum, nthreads):
+        """
+        Splits the channels into blocks of chan_block_size and grids each
+        block, and each polarisation of a vis cube, concurrently in a
+        process pool that reads the inputs from shared memory, or in a
+        thread pool reading them in place where processes can't be started.
+        The block images are summed into the final image.
+        """
+        num_chan = len(freq)
+        blocks = [slice(start, start + self.chan_block_size) for start in range(0, num_chan, self.chan_block_size)]
+        pols = range(vis.shape[2]) if vis.ndim == 3 else [None]
+        tasks = list(itertools.product(blocks, pols))
+        workers = max(1, min(len(tasks), nthreads))
+        kwargs = dict(npix_x=self.npix_x, npix_y=self.npix_y, pixsize_x=self.pixsize_x, pixsize_y=self.pixsize_y,
+            epsilon=self.epsilon, do_wstacking=self.do_wstacking, nthreads=max(1, nthreads // workers))
+        arrays = (uvw, freq, vis, weight_spectrum)
+        if workers == 1:
+            # nothing runs concurrently, so neither a pool nor shared copies pay off
+            return _sum_blocks((_ms2dirty_arrays(arrays, chans, pol, kwargs) for chans, pol in tasks), len(pols))
+
+        pool = pool_executor(workers)
+        shms = []
+        try:
+            if isinstance(pool, concurrent.futures.ProcessPoolExecutor):
+                shared = []
+                for array in arrays:
+                    shm, shared_array = SharedArray.create(np.asarray(array))
+                    shms.append(shm)
+                    shared.append(shared_array)
+                grid = functools.partial(_ms2dirty_block, shared)
+            else:
+                grid = functools.partial(_ms2dirty_arrays, arrays)
+            with pool:
+                futures = [pool.submit(grid, chans, pol, kwargs) for chans, pol in tasks]
+                return _sum_blocks((future.result() for future in concurrent.futures.as_completed(futures)),
+                                   len(pols))
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+
+    def ms2dirtyCube(self, uvw, freq, vis, weight_spectrum, nthreads):
+        """
+        Grids each polarisation of a (rows, chans, pols) visibility cube
+        concurrently into a (pols, npix_x, npix_y) image cube. uvw and freq
+        are shared by all polarisations, as is a 2D weight_spectrum.
+        """
+        num_pols = vis.shape[2]
+        workers = max(1, min(num_pols, nthreads))
+        image = None
+
+        def grid(pol):
+            weights = weight_spectrum[:, :, pol] if weight_spectrum.ndim == 3 else weight_spectrum
+            return pol, self.ms2dirty(uvw, freq, vis[:, :, pol], weights, max(1, nthreads // workers))
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            for pol, pol_image in pool.map(grid, range(num_pols)):
+                if image is None:
+                    image = np.empty((num_pols,) + pol_image.shape, dtype=pol_image.dtype)
+                image[pol] = pol_image
+        return image
+
 
+##
+# @brief StreamingMS2DirtyApp
+# @details Grids row blocks of visibilities into a running dirty image as they
+# arrive on its streaming inputs, and outputs the summed image at end of stream.
+# Gridding runs synchronously on the producer's writer thread inside its write,
+# so every block gridded stalls the producer; min_chunk_rows sets how many rows
+# are buffered per ms2dirty call, each of which pays for a full grid FFT.
+# @par EAGLE_START
+# @param category PythonApp
+# @param[in] param/appclass appclass/daliuge_component_nifty.StreamingMS2DirtyApp/String/readonly/False/
+#     \~English Application class
+# @param[in] param/npix_x npix_x/64/Integer/readwrite/False/
+#     \~English x dimensions of the dirty image
+# @param[in] param/npix_y npix_y/64/Integer/readwrite/False/
+#     \~English y dimensions of the dirty image
+# @param[in] param/do_wstacking do_wstacking/True/Bool/readwrite/False/
+#     \~English whether to perform wstacking
+# @param[in] param/pixsize_x pixsize_x//Float/readwrite/False/
+#     \~English pixel horizontal angular size in radians
+# @param[in] param/pixsize_y pixsize_y//Float/readwrite/False/
+#     \~English pixel vertical angular size in radians
+# @param[in] param/epsilon epsilon/1e-6/Float/readwrite/False/
+#     \~English gridding accuracy, at least 1e-5 for single precision
+# @param[in] param/precision precision/double/String/readwrite/False/
+#     \~English single (float32/complex64) or double (float64/complex128) precision gridding
+# @param[in] param/nthreads nthreads/1/Integer/readwrite/False/
+#     \~English number of gridding threads, 0 for all cores
+# @param[in] param/min_chunk_rows min_chunk_rows/0/Integer/readwrite/False/
+#     \~English minimum number of rows to buffer before gridding them, 0 to buffer
+#     as many visibilities per polarization as the image has pixels
+# @param[in] port/uvw uvw/ndarray/
+#     \~English streaming uvw port
+# @param[in] port/freq freq/ndarray/
+#     \~English streaming freq port
+# @param[in] port/vis vis/ndarray/
+#     \~English streaming vis port
+# @param[in] port/weight_spectrum weight_spectrum/ndarray/
+#     \~English streaming weight spectrum port
+# @param[out] port/image image/ndarray/
+#     \~English dirty image port of shape (npix_x, npix_y), or (pols, npix_x, npix_y) for a vis cube
+# @par EAGLE_END
+class StreamingMS2DirtyApp(AppDROP):
+    component_meta = dlg_component('StreamingMS2DirtyApp', 'Nifty Streaming Ms2Dirty App.',
+                                    [dlg_batch_input('binary/*', [])],
+                                    [dlg_batch_output('binary/*', [])],
+                                    [dlg_streaming_input('binary/*')])
+    npix_x = dlg_int_param('npix_x', 64)
+    npix_y = dlg_int_param('npix_y', 64)
+    do_wstacking = dlg_bool_param('do_wstacking', True)
+    pixsize_x = dlg_float_param('pixsize_x', None)
+    pixsize_y = dlg_float_param('pixsize_y', None)
+    epsilon = dlg_float_param('epsilon', 1e-6)
+    precision = dlg_string_param('precision', 'double')
+    nthreads = dlg_int_param('nthreads', 1)
+    min_chunk_rows = dlg_int_param('min_chunk_rows', 0)
+
+    # streaming input positions
+    UVW, FREQ, VIS, WEIGHT_SPECTRUM = range(4)
+
+    def initialize(self, **kwargs):
+        super().initialize(**kwargs)
+        self._lock = threading.Lock()
+        self._readers = [NpyStreamReader() for _ in range(4)]
+        self._pending = [[] for _ in range(4)]
+        self._freq = None
+        self._num_pol = None
+        self._image = None
+        self._finished = set()
+
+    def dataWritten(self, uid, data):
+        with self._lock:
+            if self.execStatus == AppDROPStates.ERROR:
+                return
+            self.execStatus = AppDROPStates.RUNNING
+            # errors must not propagate into the producer's write
+            try:
+                port = self._port(uid)
+                rows = self._readers[port].feed(data)
+                if rows is not None:
+                    self._pending[port].append(rows)
+                # gridding runs here on the writer's thread, blocking its write
+                self._grid(self.min_chunk_rows)
+            except Exception:
+                logger.exception("Error while gridding a block in %r", self)
+                self.execStatus = AppDROPStates.ERROR
+
+    def dropCompleted(self, uid, drop_state):
+        with self._lock:
+            if drop_state == DROPStates.ERROR:
+                self.execStatus = AppDROPStates.ERROR
+            self._finished.add(uid)
+            if len(self._finished) < len(self.streamingInputs):
+                return
+            if self.execStatus != AppDROPStates.ERROR:
+                try:
+                    self._grid(1)
+                    if self._image is None:
+                        shape = (self.npix_x, self.npix_y)
+                        self._image = np.zeros(shape if self._num_pol in (None, 1) else (self._num_pol,) + shape)
+                    numpy_to_drop(self._image, self.outputs[0])
+                    self.execStatus = AppDROPStates.FINISHED
+                except Exception:
+                    logger.exception("Error while gridding final block in %r", self)
+                    self.execStatus = AppDROPStates.ERROR
+        self._notifyAppIsFinished()
+
+    def _port(self, uid) -> int:
+        uids = [drop.uid for drop in self.streamingInputs]
+        if len(uids) < 4:
+            raise DaliugeException(f"StreamingMS2DirtyApp has {len(uids)} streaming input drops but requires 4")
+        return uids.index(uid)
+
+    def _numPol(self) -> int:
+        """
+        Returns the number of polarisations of the vis stream, checking that
+        its rows and those of weight_spectrum hold whole channels of them.
+        """
+        num_chan = len(self._freq)
+        vis_cells = int(np.prod(self._readers[self.VIS].shape[1:]))
+        weight_cells = int(np.prod(self._readers[self.WEIGHT_SPECTRUM].shape[1:]))
+        if num_chan == 0 or vis_cells % num_chan:
+            raise DaliugeException(f"StreamingMS2DirtyApp vis rows of shape {self._readers[self.VIS].shape[1:]} "
+                                   f"don't hold whole channels of {num_chan}")
+        num_pol = vis_cells // num_chan
+        if weight_cells not in (num_chan, vis_cells):
+            raise DaliugeException(f"StreamingMS2DirtyApp weight_spectrum rows of shape "
+                                   f"{self._readers[self.WEIGHT_SPECTRUM].shape[1:]} don't match vis")
+        return num_pol
+
+    def _take(self, port, num_rows) -> np.ndarray:
+        blocks = np.concatenate(self._pending[port])
+        self._pending[port] = [blocks[num_rows:]] if len(blocks) > num_rows else []
+        return blocks[:num_rows]
+
+    def _grid(self, min_rows):
+        """
+        Grids the rows received on all of uvw, vis and weight_spectrum so far
+        once at least min_rows of them are available. A min_rows of 0 waits for
+        enough rows to fill the image with one visibility per pixel, so the FFT
+        of each ms2dirty call is amortized over a real block of rows.
+        """
+        if self._freq is None:
+            if not self._readers[self.FREQ].complete:
+                return
+            self._freq = np.concatenate(self._pending[self.FREQ]).reshape(-1)
+            if self.pixsize_x == None:
+                self.pixsize_x = 1.0 / self.npix_x
+            if self.pixsize_y == None:
+                self.pixsize_y = 1.0 / self.npix_y
+        if self._num_pol is None:
+            if self._readers[self.VIS].shape is None or self._readers[self.WEIGHT_SPECTRUM].shape is None:
+                return
+            self._num_pol = self._numPol()
+        if min_rows <= 0:
+            min_rows = -(-self.npix_x * self.npix_y // len(self._freq))
+        ports = (self.UVW, self.VIS, self.WEIGHT_SPECTRUM)
+        num_rows = min(sum(len(block) for block in self._pending[port]) for port in ports)
+        if num_rows == 0 or num_rows < min_rows:
+            return
+        uvw, vis, weight_spectrum = (self._take(port, num_rows) for port in ports)
+        num_chan = len(self._freq)
+        real_dtype, complex_dtype = precision_dtypes(self.precision)
+        # rows may have lost their channel or pol axes to squeeze
+        vis = vis.reshape(num_rows, num_chan, self._num_pol).astype(complex_dtype, copy=False)
+        weight_spectrum = weight_spectrum.reshape(num_rows, num_chan, -1).astype(real_dtype, copy=False)
+        import ducc0.wgridder
+        images = [ducc0.wgridder.ms2dirty(uvw, self._freq, vis[:, :, pol],
+            weight_spectrum[:, :, pol if weight_spectrum.shape[2] > 1 else 0],
+            npix_x=self.npix_x, npix_y=self.npix_y, pixsize_x=self.pixsize_x, pixsize_y=self.pixsize_y,
+            epsilon=self.epsilon, do_wstacking=self.do_wstacking, nthreads=num_threads(self.nthreads))
+            for pol in range(self._num_pol)]
+        image = images[0] if self._num_pol == 1 else np.stack(images)
+        if self._image is None:
+            self._image = image
+        else:
+            self._image += image
+
+
+@dataclass
+class RowBlock:
+    """
+    Buffers for a block of measurement set rows, filled in place.
+    """
+    uvw: np.ndarray
+    antenna1: np.ndarray
+    antenna2: np.ndarray
+    vis: np.ndarray
+    weight: np.ndarray
+    flag: np.ndarray
+
+    @classmethod
+    def allocate(cls, num_rows, num_chan, num_pol, real_dtype, complex_dtype) -> "RowBlock":
+        cells = (num_rows, num_chan, num_pol)
+        return cls(np.empty((num_rows, 3)), np.empty(num_rows, np.int32), np.empty(num_rows, np.int32),
+                   np.empty(cells, complex_dtype), np.empty(cells, real_dtype), np.empty(cells, np.bool_))
+
+
+##
+# @brief PrefetchMS2DirtyApp
+# @details Reads a measurement set in row blocks and grids them into a dirty
+# image, reading the next block on a background thread while the current one
+# is gridded.
+# @par EAGLE_START
+# @param category PythonApp
+# @param[in] param/appclass appclass/daliuge_component_nifty.PrefetchMS2DirtyApp/String/readonly/False/
+#     \~English Application class
+# @param[in] param/row_start row_start/0/Integer/readwrite/False/
+#     \~English first row to read
+# @param[in] param/row_end row_end/None/Integer/readwrite/False/
+#     \~English last row to read
+# @param[in] param/chan_start chan_start/0/Integer/readwrite/False/
+#     \~English first channel to read
+# @param[in] param/chan_end chan_end/None/Integer/readwrite/False/
+#     \~English last channel to read
+# @param[in] param/pol pol/0/Integer/readwrite/False/
+#     \~English correlation to grid
+# @param[in] param/stokes stokes//String/readwrite/False/
+#     \~English if set to I, grid the Stokes I combination of the parallel hands instead of pol
+# @param[in] param/npix_x npix_x/64/Integer/readwrite/False/
+#     \~English x dimensions of the dirty image
+# @param[in] param/npix_y npix_y/64/Integer/readwrite/False/
+#     \~English y dimensions of the dirty image
+# @param[in] param/do_wstacking do_wstacking/True/Bool/readwrite/False/
+#     \~English whether to perform wstacking
+# @param[in] param/pixsize_x pixsize_x//Float/readwrite/False/
+#     \~English pixel horizontal angular size in radians
+# @param[in] param/pixsize_y pixsize_y//Float/readwrite/False/
+#     \~English pixel vertical angular size in radians
+# @param[in] param/epsilon epsilon/1e-6/Float/readwrite/False/
+#     \~English gridding accuracy, at least 1e-5 for single precision
+# @param[in] param/precision precision/double/String/readwrite/False/
+#     \~English single (float32/complex64) or double (float64/complex128) precision gridding
+# @param[in] param/nthreads nthreads/1/Integer/readwrite/False/
+#     \~English number of gridding threads, 0 for all cores
+# @param[in] param/block_rows block_rows/100000/Integer/readwrite/False/
+#     \~English rows read and gridded per block, rounded down to whole tiles of DATA
+# @param[in] param/prefetch_blocks prefetch_blocks/1/Integer/readwrite/False/
+#     \~English number of blocks read ahead of the one being gridded
+# @param[in] port/ms ms/PathBasedDrop/
+#     \~English PathBasedDrop to a Measurement Set
+# @param[out] port/image image/ndarray/
+#     \~English dirty image port
+# @par EAGLE_END
+class PrefetchMS2DirtyApp(BarrierAppDROP):
+    component_meta = dlg_component('PrefetchMS2DirtyApp', 'Nifty Prefetching MS Read and Ms2Dirty App.',
+                                    [dlg_batch_input('binary/*', [])],
+                                    [dlg_batch_output('binary/*', [])],
+                                    [dlg_streaming_input('binary/*')])
+    row_start = dlg_int_param('row_start', 0)
+    row_end = dlg_int_param('row_end', None)
+    chan_start = dlg_int_param('chan_start', 0)
+    chan_end = dlg_int_param('chan_end', None)
+    pol = dlg_int_param('pol', 0)
+    stokes = dlg_string_param('stokes', None)
+    npix_x = dlg_int_param('npix_x', 64)
+    npix_y = dlg_int_param('npix_y', 64)
+    do_wstacking = dlg_bool_param('do_wstacking', True)
+    pixsize_x = dlg_float_param('pixsize_x', None)
+    pixsize_y = dlg_float_param('pixsize_y', None)
+    epsilon = dlg_float_param('epsilon', 1e-6)
+    precision = dlg_string_param('precision', 'double')
+    nthreads = dlg_int_param('nthreads', 1)
+    block_rows = dlg_int_param('block_rows', 100000)
+    prefetch_blocks = dlg_int_param('prefetch_blocks', 1)
+
+    @instrumented
+    def run(self):
+        if len(self.inputs) < 1:
+            raise DaliugeException(f"PrefetchMS2DirtyApp has {len(self.inputs)} input drops but requires at least 1")
+        if self.block_rows < 1 or self.prefetch_blocks < 1:
+            raise DaliugeException("PrefetchMS2DirtyApp block_rows and prefetch_blocks must be at least 1")
+        real_dtype, complex_dtype = precision_dtypes(self.precision)
+        with phase("open"):
+            import casacore.tables
+            msm = casacore.tables.table(self.inputs[0].path, readonly=True, ack=False)
+            mssw = casacore.tables.table(msm.getkeyword("SPECTRAL_WINDOW"), readonly=True, ack=False)
+
+        try:
+            image = self.gridBlocks(msm, mssw, real_dtype, complex_dtype)
+        finally:
+            mssw.close()
+            msm.close()
+        numpy_to_drop(image, self.outputs[0])
+
+    def gridBlocks(self, msm, mssw, real_dtype, complex_dtype) -> np.ndarray:
+        """
+        Grids the selected rows of msm block by block while the next blocks
+        are read in the background, see prefetch_blocks.
+        """
+        row_end = msm.nrows() if self.row_end is None or self.row_end < 0 else min(self.row_end, msm.nrows())
+        chan_slice = slice(self.chan_start, self.chan_end)
+        freq = mssw.getcell("CHAN_FREQ", 0)[chan_slice]
+        if self.stokes:
+            if self.stokes.upper() != "I":
+                raise DaliugeException(f"PrefetchMS2DirtyApp stokes {self.stokes} is not supported, only I")
+            # read only the two parallel hands
+            a, b = sorted(parallel_hands(msm))
+            pol_slice = slice(a, b + 1, b - a)
+            num_pol = 2
+        else:
+            # pol may count from the end
+            pol_slice = slice(self.pol, self.pol + 1 or None)
+            num_pol = 1
+        cells = (chan_slice, pol_slice)
         if self.pixsize_x == None:
             self.pixsize_x = 1.0 / self.npix_x
         if self.pixsize_y == None:
             self.pixsize_y = 1.0 / self.npix_y
 
-        image = ducc0.wgridder.ms2dirty(uvw, freq, vis, weight_spectrum,
-            npix_x=self.npix_x, npix_y=self.npix_y, pixsize_x=self.pixsize_x, pixsize_y=self.pixsize_y,
-            epsilon=epsilon, do_wstacking=self.do_wstacking)
+        block_rows = self.block_rows
+        tile = tile_rows(msm, "DATA")
+        if tile and block_rows > tile:
+            block_rows -= block_rows % tile
+        blocks = [(start, min(block_rows, row_end - start)) for start in range(self.row_start, row_end, block_rows)]
+        buffers = [RowBlock.allocate(min(block_rows, max(1, row_end - self.row_start)), len(freq), num_pol,
+                                     real_dtype, complex_dtype)
+                   for _ in range(min(len(blocks), self.prefetch_blocks) + 1)]
 
-        numpy_to_drop(image, self.outputs[0])
+        image = np.zeros((self.npix_x, self.npix_y), dtype=real_dtype)
+        prefetched = prefetch_blocks(blocks, functools.partial(self.readBlock, msm, cells), buffers)
+        try:
+            for (_, num_rows), block in prefetched:
+                vis, weight = block.vis[:num_rows], block.weight[:num_rows]
+                if self.stokes:
+                    vis, weight = stokes_i_vis(vis, block.flag[:num_rows]), stokes_i_weight(weight)
+                else:
+                    vis, weight = vis[..., 0], weight[..., 0]
+                with phase("grid"):
+                    import ducc0.wgridder
+                    image += ducc0.wgridder.ms2dirty(block.uvw[:num_rows], freq, vis, weight,
+                        npix_x=self.npix_x, npix_y=self.npix_y, pixsize_x=self.pixsize_x, pixsize_y=self.pixsize_y,
+                        epsilon=self.epsilon, do_wstacking=self.do_wstacking, nthreads=num_threads(self.nthreads))
+        finally:
+            # stops the reader thread before the table is closed
+            prefetched.close()
+        return image
+
+    @staticmethod
+    def readBlock(msm, cells, rows, block: RowBlock):
+        """
+        Reads rows, a (startrow, nrow) pair, into block and zeroes the
+        weights of flagged visibilities and autocorrelations.
+        """
+        start, num_rows = rows
+        read_column_into(msm, "UVW", block.uvw[:num_rows], start)
+        read_column_into(msm, "ANTENNA1", block.antenna1[:num_rows], start)
+        read_column_into(msm, "ANTENNA2", block.antenna2[:num_rows], start)
+        read_column_into(msm, "DATA", block.vis[:num_rows], start, cells)
+        read_column_into(msm, "WEIGHT_SPECTRUM", block.weight[:num_rows], start, cells)
+        flag = block.flag[:num_rows]
+        read_column_into(msm, "FLAG", flag, start, cells)
+        autocorr = block.antenna1[:num_rows] == block.antenna2[:num_rows]
+        np.logical_or(flag, autocorr[:, np.newaxis, np.newaxis], out=flag)
+        np.copyto(block.weight[:num_rows], 0, where=flag)
 
 
 ##
@@ -104,6 +637,16 @@ class MS2DirtyApp(BarrierAppDROP):
 #     \~English pixel horizontal angular size in radians
 # @param[in] param/pixsize_y pixsize_y//Float/readwrite/False/
 #     \~English pixel vertical angular size in radians
+# @param[in] param/epsilon epsilon/1e-6/Float/readwrite/False/
+#     \~English gridding accuracy, at least 1e-5 for single precision
+# @param[in] param/precision precision/double/String/readwrite/False/
+#     \~English single (float32/complex64) or double (float64/complex128) precision gridding
+# @param[in] param/nthreads nthreads/1/Integer/readwrite/False/
+#     \~English number of gridding threads, 0 for all cores
+# @param[in] param/cache_dir cache_dir//String/readwrite/False/
+#     \~English if set, directory of an on-disk result cache keyed by the inputs and parameters, shareable between workers
+# @param[in] param/cache_max_bytes cache_max_bytes//Integer/readwrite/False/
+#     \~English size limit of cache_dir, least recently used results are evicted beyond it
 # @param[in] port/uvw uvw/ndarray/
 #     \~English uvw port
 # @param[in] port/freq freq/ndarray/
@@ -123,22 +666,33 @@ class Dirty2MSApp(BarrierAppDROP):
     pixsize_x = dlg_float_param('pixsize_x', None)
     pixsize_y = dlg_float_param('pixsize_y', None)
     do_wstacking = dlg_bool_param('do_wstacking', None)
+    epsilon = dlg_float_param('epsilon', 1e-6)
+    precision = dlg_string_param('precision', 'double')
+    nthreads = dlg_int_param('nthreads', 1)
+    cache_dir = dlg_string_param('cache_dir', None)
+    cache_max_bytes = dlg_int_param('cache_max_bytes', None)
 
+    @instrumented
     def run(self):
         if len(self.inputs) < 4:
             raise DaliugeException(f"CudaDirt2MsApp has {len(self.inputs)} input drops but requires at least 4")
+        real_dtype, _ = precision_dtypes(self.precision)
         uvw = drop_to_numpy(self.inputs[0])
         freq = drop_to_numpy(self.inputs[1])
-        dirty = drop_to_numpy(self.inputs[2])
-        weight_spectrum = drop_to_numpy(self.inputs[3])
-        epsilon = 1e-6  # unused
+        dirty = drop_to_numpy(self.inputs[2]).astype(real_dtype, copy=False)
+        weight_spectrum = drop_to_numpy(self.inputs[3]).astype(real_dtype, copy=False)
+        vis = cached_result(self, (uvw, freq, dirty, weight_spectrum),
+                            lambda: self.makeVis(uvw, freq, dirty, weight_spectrum))
+        numpy_to_drop(vis, self.outputs[0])
 
+    def makeVis(self, uvw, freq, dirty, weight_spectrum):
         if self.pixsize_x == None:
             self.pixsize_x = 1.0 / dirty.shape[0]
         if self.pixsize_y == None:
             self.pixsize_y = 1.0 / dirty.shape[1]
 
-        vis = ducc0.wgridder.dirty2ms(uvw, freq, dirty, weight_spectrum,
-            self.pixsize_x, self.pixsize_y, epsilon, self.do_wstacking)
-
-        numpy_to_drop(vis, self.outputs[0])
+        import ducc0.wgridder
+        with phase("degrid"):
+            return ducc0.wgridder.dirty2ms(uvw, freq, dirty, weight_spectrum,
+                pixsize_x=self.pixsize_x, pixsize_y=self.pixsize_y, epsilon=self.epsilon,
+                do_wstacking=bool(self.do_wstacking), nthreads=num_threads(self.nthreads))
@@ -21,8 +21,9 @@
 
 import io
 import numpy as np
+# wagg is imported on first use so that CPU only nodes do not need it
 
-import wagg
+from daliuge_component_nifty.metrics import instrumented, phase
 from daliuge_component_nifty.ms import drop_to_numpy, numpy_to_drop
 from dlg.exceptions import DaliugeException
 from dlg.drop import BarrierAppDROP
@@ -71,6 +72,7 @@ class CudaMS2DirtyApp(BarrierAppDROP):
     pixsize_x = dlg_float_param('pixsize_x', None)
     pixsize_y = dlg_float_param('pixsize_y', None)
 
+    @instrumented
     def run(self):
         if len(self.inputs) < 4:
             raise DaliugeException(f"CudaDirt2MsApp has {len(self.inputs)} input drops but requires at least 4")
@@ -85,9 +87,11 @@ class CudaMS2DirtyApp(BarrierAppDROP):
         if self.pixsize_y == None:
             self.pixsize_y = 1.0 / self.npix_y
 
-        image = wagg.ms2dirty(uvw, freq, vis, weight_spectrum,
-            self.npix_x, self.npix_y, self.pixsize_x, self.pixsize_y,
-            epsilon, self.do_wstacking)
+        import wagg
+        with phase("grid"):
+            image = wagg.ms2dirty(uvw, freq, vis, weight_spectrum,
+                self.npix_x, self.npix_y, self.pixsize_x, self.pixsize_y,
+                epsilon, self.do_wstacking)
 
         numpy_to_drop(image, self.outputs[0])
 
@@ -125,6 +129,7 @@ class CudaDirty2MSApp(BarrierAppDROP):
     pixsize_y = dlg_float_param('pixsize_y', None)
     do_wstacking = dlg_bool_param('do_wstacking', None)
 
+    @instrumented
     def run(self):
         if len(self.inputs) < 4:
             raise DaliugeException(f"CudaDirt2MsApp has {len(self.inputs)} input drops but requires at least 4")
@@ -139,8 +144,10 @@ class CudaDirty2MSApp(BarrierAppDROP):
         if self.pixsize_y == None:
             self.pixsize_y = 1.0 / dirty.shape[1]
 
-        vis = wagg.dirty2ms(uvw, freq, dirty, weight_spectrum,
-            self.pixsize_x, self.pixsize_y, epsilon, self.do_wstacking)
+        import wagg
+        with phase("degrid"):
+            vis = wagg.dirty2ms(uvw, freq, dirty, weight_spectrum,
+                self.pixsize_x, self.pixsize_y, epsilon, self.do_wstacking)
 
         numpy_to_drop(vis, self.outputs[0])
 
@@ -191,6 +198,7 @@ class CudaNiftyApp(BarrierAppDROP):
     pixsize_y = dlg_float_param('pixsize_y', None)
     polarization = dlg_int_param('polarization', 0)
 
+    @instrumented
     def run(self):
         if len(self.inputs) < 4:
             raise DaliugeException(f"CudaDirt2MsApp has {len(self.inputs)} input drops but requires at least 4")
@@ -203,15 +211,18 @@ class CudaNiftyApp(BarrierAppDROP):
 
         uvw = drop_to_numpy(self.inputs[0])
         freq = drop_to_numpy(self.inputs[1])
-        vis = drop_to_numpy(self.inputs[2])
+        vis = drop_to_numpy(self.inputs[2], writable=True)
         weight_spectrum = drop_to_numpy(self.inputs[3])
 
-        image_dirty = wagg.ms2dirty(uvw, freq, vis, weight_spectrum,
-            self.npix_x, self.npix_y, self.pixsize_x, self.pixsize_y,
-            epsilon, self.do_wstacking)
+        import wagg
+        with phase("grid"):
+            image_dirty = wagg.ms2dirty(uvw, freq, vis, weight_spectrum,
+                self.npix_x, self.npix_y, self.pixsize_x, self.pixsize_y,
+                epsilon, self.do_wstacking)
         numpy_to_drop(image_dirty, self.outputs[0])
 
-        vis_degridded = wagg.dirty2ms(uvw, freq, image_dirty, weight_spectrum,
-            self.pixsize_x, self.pixsize_y, epsilon, self.do_wstacking)
+        with phase("degrid"):
+            vis_degridded = wagg.dirty2ms(uvw, freq, image_dirty, weight_spectrum,
+                self.pixsize_x, self.pixsize_y, epsilon, self.do_wstacking)
         vis[:,:,self.polarization] = vis_degridded
         numpy_to_drop(vis, self.outputs[1])
@@ -0,0 +1,169 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#    MA  02110-1301, USA.
+"""
+Per run instrumentation of the apps in this package.
+
+Decorating an app's run() with instrumented collects, for the duration of
+the run, the wall time of each phase entered through phase(), and the
+shape, dtype, size and transfer time of every array read with
+drop_to_numpy or written with numpy_to_drop. At the end of the run the
+record, including the process peak RSS, is logged at DEBUG on the app
+module's logger and passed to the sink set with set_metrics_sink.
+
+When neither is active runs are not instrumented, and phase() and
+record_array() reduce to a context variable lookup.
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import resource
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MetricsSink = Callable[[dict], None]
+
+_sink: Optional[MetricsSink] = None
+_current: contextvars.ContextVar = contextvars.ContextVar("run_metrics", default=None)
+_NOT_RECORDING = contextlib.nullcontext()
+
+
+def set_metrics_sink(sink: Optional[MetricsSink]):
+    """
+    Passes the record of every instrumented run to sink, e.g. to push
+    them to a monitoring system. None removes the sink.
+    """
+    global _sink
+    _sink = sink
+
+
+def peak_rss_bytes() -> int:
+    """
+    Peak resident set size of this process so far.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RunMetrics:
+    def __init__(self, app):
+        self.app = app
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.arrays: List[dict] = []
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def add_phase(self, name: str, seconds: float):
+        # phases entered repeatedly, e.g. once per row chunk, accumulate
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_array(self, direction: str, drop, array: np.ndarray, seconds: float):
+        if direction == "read":
+            self.bytes_read += array.nbytes
+        else:
+            self.bytes_written += array.nbytes
+        self.arrays.append({
+            "direction": direction,
+            "drop": getattr(drop, "uid", None),
+            "shape": list(array.shape),
+            "dtype": str(array.dtype),
+            "nbytes": array.nbytes,
+            "seconds": seconds,
+        })
+
+    def record(self) -> dict:
+        return {
+            "app": type(self.app).__name__,
+            "uid": self.app.uid,
+            "wall_s": time.perf_counter() - self.start,
+            "phases": self.phases,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "arrays": self.arrays,
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+
+@contextlib.contextmanager
+def _timed(metrics: RunMetrics, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_phase(name, time.perf_counter() - start)
+
+
+def phase(name: str):
+    """
+    Context manager timing a phase of the current instrumented run.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return _NOT_RECORDING
+    return _timed(metrics, name)
+
+
+def recording() -> bool:
+    return _current.get() is not None
+
+
+def record_array(direction: str, drop, array: np.ndarray, seconds: float):
+    """
+    Records an array read from or written to drop by the current
+    instrumented run, direction being "read" or "written".
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_array(direction, drop, array, seconds)
+
+
+def instrumented(run):
+    """
+    Decorates an app's run() to collect and emit its metrics.
+    """
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        app_logger = logging.getLogger(type(self).__module__)
+        if _sink is None and not app_logger.isEnabledFor(logging.DEBUG):
+            return run(self, *args, **kwargs)
+        metrics = RunMetrics(self)
+        token = _current.set(metrics)
+        try:
+            return run(self, *args, **kwargs)
+        finally:
+            _current.reset(token)
+            record = metrics.record()
+            app_logger.debug("%s run metrics: %s", self.uid, json.dumps(record))
+            if _sink is not None:
+                try:
+                    _sink(record)
+                except Exception:
+                    logger.exception("Metrics sink failed for %s", self.uid)
+    return wrapper
@@ -19,21 +19,34 @@
 #    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #    MA  02110-1301, USA.
 
+from __future__ import annotations
+
+import atexit
+import multiprocessing
 import os
 import io
+import itertools
 import logging
+import functools
 import pickle
+import queue
+import re
+import shutil
+import struct
+import tempfile
+import threading
 import urllib.error
 import urllib.request
 
 import time
 import numpy as np
-import casacore
-import casacore.tables
-from dataclasses import dataclass, astuple
-from typing import Optional, Tuple
+from dataclasses import dataclass, astuple, replace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import resource_tracker, shared_memory
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 from dlg import droputils, utils
+from dlg.ddap_protocol import AppDROPStates, DROPStates
 from dlg.drop import BarrierAppDROP, BranchAppDrop, ContainerDROP
 from dlg.exceptions import DaliugeException
 from dlg.meta import dlg_float_param, dlg_string_param
@@ -48,28 +61,904 @@ from dlg.apps.pyfunc import serialize_data, deserialize_data
 
 logger = logging.getLogger(__name__)
 
-from dlg.io import OpenMode
+from dlg.io import OpenMode, FileIO, MemoryIO
+
+from daliuge_component_nifty.cache import CACHE_EXCLUDE_PARAMS, ResultCache, cache_key
+from daliuge_component_nifty.metrics import instrumented, phase, record_array, recording
+from daliuge_component_nifty.wire import RAW, SHM, WIRE_MAGIC, c_order_chunks, is_encoded, parse_port_codecs
+from daliuge_component_nifty import wire
+
+# casacore is imported on first use so that importing the package stays cheap
+if TYPE_CHECKING:
+    import casacore.tables
+
+# bytes moved per read/write call when streaming drop contents
+IO_CHUNK_SIZE = 64 * 1024 * 1024
+
+# (real, complex) dtypes per precision parameter value
+PRECISION_DTYPES = {
+    "single": (np.float32, np.complex64),
+    "double": (np.float64, np.complex128),
+}
+
+
+def precision_dtypes(precision: str):
+    if precision not in PRECISION_DTYPES:
+        raise DaliugeException(f"precision must be one of {list(PRECISION_DTYPES)}, got {precision}")
+    return PRECISION_DTYPES[precision]
+
+
+# struct format of the header length field per .npy format version
+_NPY_HEADER_LEN_FORMATS = {(1, 0): "<H", (2, 0): "<I"}
+
+
+def _npy_header_size(buf: memoryview) -> Optional[int]:
+    """
+    Returns the size in bytes of the .npy header at the start of buf, or
+    None if the format version is not supported.
+    """
+    magic = np.lib.format.read_magic(io.BytesIO(buf[:np.lib.format.MAGIC_LEN]))
+    if magic not in _NPY_HEADER_LEN_FORMATS:
+        return None
+    hlen_fmt = _NPY_HEADER_LEN_FORMATS[magic]
+    hstart = np.lib.format.MAGIC_LEN
+    hend = hstart + struct.calcsize(hlen_fmt)
+    return hend + struct.unpack(hlen_fmt, buf[hstart:hend])[0]
+
+
+def _npy_header(buf: memoryview) -> Optional[Tuple[Tuple[int, ...], bool, np.dtype, int]]:
+    """
+    Parses the header of a .npy file held in buf without copying the payload.
+    Returns (shape, fortran_order, dtype, data_offset), or None if the file
+    can't be viewed in place (unknown format version or object dtype).
+    """
+    offset = _npy_header_size(buf)
+    if offset is None:
+        return None
+    header = io.BytesIO(buf[:offset])
+    version = np.lib.format.read_magic(header)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+    if dtype.hasobject:
+        return None
+    return shape, fortran_order, dtype, offset
+
+
+def buffer_to_numpy(buf, writable: bool = False, drop=None) -> np.ndarray:
+    """
+    Deserializes a .npy formatted buffer. By default the result is a
+    read-only view onto buf; a private copy is only made when writable
+    is requested. Buffers in an encoded wire format are decoded into a
+    new array. Shared memory segments mapped for the contents of drop are
+    unmapped with its lifecycle, see SharedDropReleaser.
+    """
+    buf = memoryview(buf).cast("B")
+    if is_encoded(buf):
+        header, _ = wire.read_header(buf)
+        if header["codec"] == SHM:
+            return _read_shared(SharedArray(header["segment"], tuple(header["shape"]), header["dtype"]),
+                                writable, drop)
+        res = wire.decode(buf, IO_CHUNK_SIZE)
+        res.flags.writeable = writable
+        return res
+    header = _npy_header(buf)
+    if header is None:
+        return np.load(io.BytesIO(buf), allow_pickle=False)
+    shape, fortran_order, dtype, offset = header
+    count = int(np.prod(shape, dtype=np.int64))
+    res = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+    res = res.reshape(shape, order="F" if fortran_order else "C")
+    if writable:
+        return res.copy(order="K")
+    res.flags.writeable = False
+    return res
+
+
+def drop_to_numpy(drop, writable: bool = False) -> np.ndarray:
+    """
+    Deserializes a numpy array from drop. The returned array is a read-only
+    view onto the drop contents unless writable is True. File backed drops
+    are memory mapped.
+    """
+    if not recording():
+        return _read_drop(drop, writable)
+    start = time.perf_counter()
+    array = _read_drop(drop, writable)
+    record_array("read", drop, array, time.perf_counter() - start)
+    return array
+
+
+def _read_shared(shared: "SharedArray", writable: bool, drop) -> np.ndarray:
+    with _shared_lock:
+        mapped = shared.name in _shared_segments
+    res = attach_shared(shared)
+    if mapped:
+        return res.copy() if writable else res
+    # first mapping in this process of a segment created by another one
+    if writable:
+        res = res.copy()
+        release_shared(shared.name)
+    elif drop is not None:
+        SharedDropReleaser(drop, shared.name)
+    return res
 
-def drop_to_numpy(drop) -> np.ndarray:
+
+def _read_drop(drop, writable: bool) -> np.ndarray:
     bio = drop.getIO()
+    if isinstance(bio, MemoryIO):
+        # a view of bio.buffer() would pin the BytesIO, failing later writes
+        # and deletes while the array is alive. getvalue() shares the bytes
+        # with the BytesIO instead, without a copy until it is written to
+        return buffer_to_numpy(bio._buf.getvalue(), writable, drop)
+    if isinstance(bio, FileIO):
+        with open(bio.getFileName(), "rb") as f:
+            encoded = f.read(len(WIRE_MAGIC)) == WIRE_MAGIC
+        if encoded:
+            # decodes straight from the page cache
+            return buffer_to_numpy(np.memmap(bio.getFileName(), mode="r"), writable, drop)
+        try:
+            # pages are read on demand and shared through the page cache,
+            # writes go to private copy-on-write pages
+            return np.load(bio.getFileName(), mmap_mode="c" if writable else "r")
+        except ValueError:
+            # object dtypes and empty arrays can't be memory mapped
+            logger.debug("Cannot memory map %s, reading it instead", bio.getFileName())
     bio.open(OpenMode.OPEN_READ)
-    buf = bio.buffer()
-    res = np.load(io.BytesIO(buf))
-    bio.close()
-    return res
+    try:
+        buf = bio.buffer()
+        if buf is None:
+            # io without buffer protocol support, e.g. SharedMemoryIO
+            chunks = []
+            while True:
+                chunk = bio.read(IO_CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            buf = b"".join(chunks)
+        return buffer_to_numpy(buf, writable, drop)
+    finally:
+        bio.close()
+
+
+def write_npy_header(drop, shape: Tuple[int, ...], dtype, fortran_order: bool = False):
+    """
+    Writes the .npy header of an array with the given shape and dtype into
+    drop. The array data is expected to follow through write_npy_data.
+    """
+    d = {
+        "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        "fortran_order": fortran_order,
+        "shape": tuple(shape),
+    }
+    header = io.BytesIO()
+    try:
+        np.lib.format.write_array_header_1_0(header, d)
+    except ValueError:
+        # header too large for format version 1.0
+        header = io.BytesIO()
+        np.lib.format.write_array_header_2_0(header, d)
+    drop.write(header.getvalue())
+
+
+def write_npy_data(drop, array: np.ndarray, chunk_size: int = IO_CHUNK_SIZE):
+    """
+    Writes the elements of array into drop in C order, in chunks of at most
+    chunk_size bytes.
+    """
+    for chunk in c_order_chunks(array, chunk_size):
+        drop.write(chunk)
+
+
+def numpy_to_drop(array: np.ndarray, drop, chunk_size: int = IO_CHUNK_SIZE, codec: str = RAW):
+    """
+    Serializes array into drop in .npy format, or in the wire format of
+    codec, see daliuge_component_nifty.wire. With the shm codec the array is
+    copied into a shared memory segment and only its descriptor is written
+    to drop, see share_array. The array memory is streamed
+    into the drop in chunks of at most chunk_size bytes without building
+    an intermediate copy of the whole file.
+    """
+    array = np.asanyarray(array)
+    if not recording():
+        _write_drop(array, drop, chunk_size, codec)
+        return
+    start = time.perf_counter()
+    _write_drop(array, drop, chunk_size, codec)
+    record_array("written", drop, array, time.perf_counter() - start)
+
+
+def _write_drop(array: np.ndarray, drop, chunk_size: int, codec: str):
+    if codec == SHM:
+        shared = share_array(array)
+        drop.write(wire.encode_header(SHM, array, segment=shared.name))
+        SharedDropReleaser(drop, shared.name)
+        return
+    if codec != RAW:
+        wire.write_encoded(array, drop, codec, chunk_size)
+        return
+    if array.dtype.hasobject:
+        buf = io.BytesIO()
+        np.save(buf, array)
+        drop.write(buf.getbuffer())
+        return
+    fortran_order = array.flags.f_contiguous and not array.flags.c_contiguous
+    write_npy_header(drop, array.shape, array.dtype, fortran_order)
+    write_npy_data(drop, array.T if fortran_order else array, chunk_size)
+
+
+@dataclass
+class SharedArray:
+    """
+    Describes a numpy array held in a multiprocessing.shared_memory
+    segment. Instances are small and picklable, so they can be handed to
+    other processes which then attach to the same memory.
+    """
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    @classmethod
+    def create(cls, array: np.ndarray) -> Tuple[shared_memory.SharedMemory, "SharedArray"]:
+        """
+        Copies array into a new shared memory segment. The caller owns the
+        returned segment and must close and unlink it.
+        """
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        shared = cls(shm.name, array.shape, array.dtype.str)
+        np.copyto(np.ndarray(array.shape, array.dtype, buffer=shm.buf), array)
+        return shm, shared
+
+    def attach(self) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+        """
+        Maps the segment without copying. The returned segment must be
+        kept alive while the array is in use and closed afterwards.
+        """
+        shm = shared_memory.SharedMemory(name=self.name)
+        return shm, self.view(shm)
+
+    def view(self, shm: shared_memory.SharedMemory) -> np.ndarray:
+        """
+        Returns the array in shm. Unlike np.ndarray(buffer=...), frombuffer
+        holds a buffer export, so shm.close() refuses to unmap the segment
+        while the array is alive rather than leaving it dangling.
+        """
+        count = int(np.prod(self.shape, dtype=np.int64))
+        return np.frombuffer(shm.buf, np.dtype(self.dtype), count).reshape(self.shape)
+
+
+# segments mapped into this process by name, and those of them created here
+_shared_segments: Dict[str, shared_memory.SharedMemory] = {}
+_owned_segments: Set[str] = set()
+# released segments still mapped by live arrays, closed once they are gone
+_lingering_segments: List[shared_memory.SharedMemory] = []
+_shared_lock = threading.Lock()
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before python 3.13 attaching also registers the segment with the
+        # resource tracker, which would unlink it when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def share_array(array: np.ndarray) -> SharedArray:
+    """
+    Copies array into a new shared memory segment owned by this process.
+    The segment stays available to attach_shared, in this or any other
+    process on the node, until release_shared is called with its name or
+    this process exits.
+    """
+    shm, shared = SharedArray.create(np.asarray(array))
+    with _shared_lock:
+        _shared_segments[shm.name] = shm
+        _owned_segments.add(shm.name)
+    return shared
+
+
+def attach_shared(shared: SharedArray) -> np.ndarray:
+    """
+    Returns a read-only view of a shared array without copying. Each
+    segment is mapped at most once per process, and stays mapped until
+    release_shared is called with its name.
+    """
+    with _shared_lock:
+        shm = _shared_segments.get(shared.name)
+        if shm is None:
+            try:
+                shm = _attach_untracked(shared.name)
+            except FileNotFoundError:
+                raise DaliugeException(f"Shared memory segment {shared.name} has been released") from None
+            _shared_segments[shared.name] = shm
+    array = shared.view(shm)
+    array.flags.writeable = False
+    return array
+
+
+def release_shared(name: str):
+    """
+    Unmaps a shared memory segment from this process, and unlinks it if
+    this process created it. Arrays attached to the segment keep it mapped
+    until the last of them is gone.
+    """
+    with _shared_lock:
+        shm = _shared_segments.pop(name, None)
+        owned = name in _owned_segments
+        _owned_segments.discard(name)
+    if shm is not None:
+        with _shared_lock:
+            _lingering_segments.append(shm)
+        if owned:
+            shm.unlink()
+    _close_lingering()
+
+
+def _close_lingering():
+    with _shared_lock:
+        segments = _lingering_segments[:]
+        _lingering_segments.clear()
+    for shm in segments:
+        try:
+            shm.close()
+        except BufferError:
+            # views are still alive, the mapping goes with the last of them
+            logger.debug("Shared memory segment %s still in use, leaving it mapped", shm.name)
+            with _shared_lock:
+                _lingering_segments.append(shm)
+
+
+def release_shared_drop(drop):
+    """
+    Releases the segment of a drop written by numpy_to_drop with the shm
+    codec ahead of SharedDropReleaser, e.g. when the drop is reused.
+    """
+    bio = drop.getIO()
+    bio.open(OpenMode.OPEN_READ)
+    try:
+        # the descriptor is only a header
+        buf = memoryview(bio.read(IO_CHUNK_SIZE))
+    finally:
+        bio.close()
+    if is_encoded(buf):
+        header, _ = wire.read_header(buf)
+        if header["codec"] == SHM:
+            release_shared(header["segment"])
+
+
+class SharedDropReleaser:
+    """
+    Ties the shared memory segment written into drop by numpy_to_drop with
+    the shm codec to the drop's lifecycle. The segment is released once all
+    consumers of drop have finished, or once drop expires or is deleted,
+    whichever comes first. In the producer this unlinks the segment, in the
+    processes of the consumers it unmaps their view of it.
+    """
+    DONE_STATES = (AppDROPStates.FINISHED, AppDROPStates.ERROR, AppDROPStates.CANCELLED, AppDROPStates.SKIPPED)
+
+    def __init__(self, drop, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        consumers = drop.consumers + drop.streamingConsumers
+        self._pending = {consumer.uid for consumer in consumers
+                         if getattr(consumer, "execStatus", None) not in self.DONE_STATES}
+        drop.subscribe(self, "status")
+        for consumer in consumers:
+            consumer.subscribe(self, "execStatus")
+        if consumers and not self._pending:
+            release_shared(name)
+
+    def handleEvent(self, e):
+        if e.type == "status":
+            done = e.status in (DROPStates.EXPIRED, DROPStates.DELETED)
+        elif e.type == "execStatus" and e.execStatus in self.DONE_STATES:
+            with self._lock:
+                if e.uid not in self._pending:
+                    return
+                self._pending.discard(e.uid)
+                done = not self._pending
+        else:
+            done = False
+        if done:
+            release_shared(self.name)
+
+
+@atexit.register
+def _release_owned_segments():
+    for name in list(_owned_segments):
+        release_shared(name)
+
+
+class NpyStreamReader:
+    """
+    Incrementally decodes a .npy array from the pieces received by a
+    streaming consumer (see AppDROP.dataWritten). Complete rows along the
+    leading axis are returned as soon as their bytes have arrived, whatever
+    the size of the pieces they were written in.
+    """
+    def __init__(self):
+        self._pending = bytearray()
+        self.shape: Optional[Tuple[int, ...]] = None
+        self.dtype: Optional[np.dtype] = None
+        self.fortran_order = False
+        self.rows_read = 0
+
+    @property
+    def complete(self) -> bool:
+        if self.shape is None:
+            return False
+        return self.rows_read == (self.shape[0] if self.shape else 1)
+
+    def feed(self, data) -> Optional[np.ndarray]:
+        """
+        Consumes data and returns the rows it completed, or None if no
+        new row is complete. 0-d and Fortran ordered arrays are returned
+        whole once all of their data has arrived.
+        """
+        self._pending += data
+        if self.shape is None and not self._read_header():
+            return None
+        if self.complete:
+            return None
+        itemsize = self.dtype.itemsize
+        if len(self.shape) == 0 or self.fortran_order:
+            if len(self._pending) < int(np.prod(self.shape)) * itemsize:
+                return None
+            rows = np.frombuffer(self._pending, dtype=self.dtype)\
+                .reshape(self.shape, order="F" if self.fortran_order else "C")\
+                .copy(order="K")
+            self._pending.clear()
+            self.rows_read = self.shape[0] if self.shape else 1
+            return rows
+        row_size = int(np.prod(self.shape[1:]))
+        num_rows = self.shape[0] - self.rows_read
+        if row_size:
+            num_rows = min(num_rows, len(self._pending) // (row_size * itemsize))
+        if num_rows == 0:
+            return None
+        count = num_rows * row_size
+        rows = np.frombuffer(self._pending, dtype=self.dtype, count=count)\
+            .reshape((num_rows,) + tuple(self.shape[1:]))\
+            .copy()
+        del self._pending[:count * itemsize]
+        self.rows_read += num_rows
+        return rows
+
+    def _read_header(self) -> bool:
+        if len(self._pending) < np.lib.format.MAGIC_LEN + 4:
+            return False
+        if is_encoded(self._pending):
+            raise DaliugeException("Encoded arrays can't be streamed, use the raw codec")
+        with memoryview(self._pending) as pending:
+            offset = _npy_header_size(pending)
+            if offset is None:
+                raise DaliugeException("Unsupported .npy format version in stream")
+            if len(pending) < offset:
+                return False
+            header = _npy_header(pending)
+        if header is None:
+            raise DaliugeException("Object arrays can't be streamed")
+        self.shape, self.fortran_order, self.dtype, _ = header
+        del self._pending[:offset]
+        return True
+
+
+def _taql_slice(cells: Tuple[slice, ...]) -> str:
+    """
+    Formats normalised per-cell slices as a python style TaQL array slice.
+    """
+    if not cells:
+        return ""
+    return "[" + ",".join(f"{s.start}:{s.stop}:{s.step}" for s in cells) + "]"
+
+
+def _slice_corners(cells: Tuple[slice, ...]) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Returns the casacore blc, trc and inc of normalised, nonempty cell
+    slices, where trc is inclusive.
+    """
+    return [s.start for s in cells], [s.stop - 1 for s in cells], [s.step for s in cells]
+
+
+def _normalise_cells(cells: Tuple[slice, ...], shape: Tuple[int, ...]) -> Tuple[slice, ...]:
+    """
+    Resolves missing and negative bounds of cells against the cell shape,
+    giving slices whose stop is one past the last selected element.
+    """
+    normalised = []
+    for s, n in zip(cells, shape):
+        start, stop, step = s.indices(n)
+        if step < 1:
+            raise DaliugeException(f"Cell slice {s} must not step backwards")
+        count = len(range(start, stop, step))
+        normalised.append(slice(start, start + (count - 1) * step + 1 if count else start, step))
+    return tuple(normalised)
+
+
+def _selection(table: casacore.tables.table, name: str, startrow: int,
+               cells: Tuple[slice, ...]) -> Optional[Tuple[Tuple[slice, ...], Tuple[int, ...], np.dtype]]:
+    """
+    Returns the normalised cells, the shape of the selected part of a cell
+    and the dtype of column name, or None if the table has no rows.
+    """
+    if table.nrows() == 0:
+        return None
+    cell = np.asarray(table.getcell(name, min(startrow, table.nrows() - 1)))
+    cells = _normalise_cells(cells, cell.shape)
+    shape = tuple(len(range(s.start, s.stop, s.step)) for s in cells) + cell.shape[len(cells):]
+    return cells, shape, cell.dtype
+
+
+def read_column(table: casacore.tables.table, name: str,
+                rows: Tuple[int, int], cells: Tuple[slice, ...], dtype=None) -> np.ndarray:
+    """
+    Reads nrow rows of a column or TaQL expression starting at startrow,
+    where rows is (startrow, nrow) and nrow=-1 reads to the end. The cells
+    slices select along each cell axis and are passed down to casacore so
+    that unselected cells are never read. Expressions mark each column
+    reference to be sliced with "{cells}", and all columns they slice must
+    share one cell shape.
+
+    If dtype is given, columns are read into a new array of that dtype,
+    casacore converting the values, so that no array of the column's own
+    dtype is allocated. Expressions are returned as evaluated.
+    """
+    startrow, nrow = rows
+    if nrow < 0:
+        nrow = max(0, table.nrows() - startrow)
+    is_column = name in table.colnames()
+    sliced = re.search(r"(\w+)\{cells\}", name)
+    selection = None
+    if is_column or sliced:
+        selection = _selection(table, name if is_column else sliced.group(1), startrow, cells)
+    if selection is not None:
+        cells, shape, column_dtype = selection
+        if nrow == 0 or 0 in shape:
+            return np.empty((nrow,) + shape, dtype=dtype or column_dtype)
+    if is_column:
+        if dtype is not None and selection is not None:
+            out = np.empty((nrow,) + shape, dtype=dtype)
+            read_column_into(table, name, out, startrow, cells)
+            return out
+        if not cells:
+            return table.getcol(name, startrow=startrow, nrow=nrow)
+        blc, trc, inc = _slice_corners(cells)
+        return table.getcolslice(name, blc, trc, inc, startrow=startrow, nrow=nrow)
+    expr = name.replace("{cells}", _taql_slice(cells))
+    # limit=0 means no limit to TaQL
+    offset = startrow if nrow > 0 else table.nrows()
+    return table.query(columns=f"{expr} as COL", offset=offset, limit=nrow)\
+        .getcol("COL")
+
+
+def read_column_into(table: casacore.tables.table, name: str, out: np.ndarray,
+                     startrow: int, cells: Tuple[slice, ...] = ()):
+    """
+    Reads len(out) rows of a column starting at startrow into out, which
+    casacore fills in place, converting to its dtype. The cells slices
+    select along each cell axis as for read_column, and out must have the
+    shape of the selection.
+    """
+    if out.size == 0:
+        return
+    if not cells:
+        table.getcolnp(name, out, startrow=startrow, nrow=len(out))
+        return
+    cells, _, _ = _selection(table, name, startrow, cells)
+    blc, trc, inc = _slice_corners(cells)
+    table.getcolslicenp(name, out, blc, trc, inc, startrow=startrow, nrow=len(out))
+
+
+def prefetch_blocks(blocks: Iterable, fill: Callable, buffers: list) -> Iterator[tuple]:
+    """
+    Yields (block, buffer) for each of blocks once fill(block, buffer) has
+    filled one of buffers. A background thread fills the buffers for the
+    next blocks while the caller processes the current one, and a buffer is
+    reused once the caller moves on to the next block, so at most
+    len(buffers) - 1 blocks are read ahead. Errors in fill are raised in
+    the caller.
+    """
+    free = queue.Queue()
+    for buffer in buffers:
+        free.put(buffer)
+    ready = queue.Queue(maxsize=len(buffers))
+    stop = threading.Event()
+
+    def reader():
+        try:
+            for block in blocks:
+                buffer = free.get()
+                if stop.is_set():
+                    return
+                fill(block, buffer)
+                ready.put((block, buffer))
+        except BaseException as e:
+            ready.put(e)
+            return
+        ready.put(None)
+
+    thread = threading.Thread(target=reader, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            with phase("prefetch_wait"):
+                item = ready.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+            free.put(item[1])
+    finally:
+        stop.set()
+        # wake the reader if it waits for a buffer
+        free.put(None)
+        thread.join()
+
+
+def tile_rows(table: casacore.tables.table, name: str) -> Optional[int]:
+    """
+    Returns the number of rows per tile of a column stored by a tiled
+    storage manager, or None for other storage managers.
+    """
+    spec = table.getdminfo(name).get("SPEC", {})
+    for hypercube in spec.get("HYPERCUBES", {}).values():
+        return int(hypercube["TileShape"][-1])
+    default = spec.get("DEFAULTTILESHAPE")
+    if default is not None and len(default) > 0:
+        return int(default[-1])
+    return None
+
+
+def write_column(table: casacore.tables.table, name: str, data: np.ndarray,
+                 startrow: int = 0, chunk_rows: Optional[int] = None):
+    """
+    Writes data, indexed by row along its first axis, to column name from
+    startrow on in blocks of chunk_rows rows, so that only one block at a
+    time is converted and buffered by casacore and memory mapped data is
+    paged in block by block. Without chunk_rows, blocks are sized to about
+    IO_CHUNK_SIZE bytes and, for tiled columns, end on tile boundaries.
+    """
+    nrow = len(data)
+    if nrow == 0:
+        return
+    rows_per_tile = None
+    if not chunk_rows:
+        row_bytes = max(1, data.itemsize * int(np.prod(data.shape[1:])))
+        chunk_rows = max(1, IO_CHUNK_SIZE // row_bytes)
+        rows_per_tile = tile_rows(table, name)
+        if rows_per_tile:
+            chunk_rows = max(rows_per_tile, chunk_rows - chunk_rows % rows_per_tile)
+    start = 0
+    while start < nrow:
+        stop = min(nrow, start + chunk_rows)
+        if rows_per_tile and stop < nrow and (startrow + stop) % rows_per_tile > 0:
+            # the first block of an unaligned startrow is shortened
+            stop = max(start + 1, stop - (startrow + stop) % rows_per_tile)
+        table.putcol(name, data[start:stop], startrow=startrow + start, nrow=stop - start)
+        start = stop
+
+
+def live_rows(weight_spectrum: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Returns a boolean array selecting the rows of weight_spectrum with at
+    least one nonzero weight, ignoring cells where mask is True. Other rows
+    contribute nothing to gridding.
+    """
+    live = weight_spectrum != 0
+    if mask is not None:
+        live &= ~mask
+    return live.reshape(len(live), -1).any(axis=1)
+
+
+class FlagMasks:
+    """
+    Reads FLAG, ANTENNA1 and ANTENNA2 at most once for a row and cell
+    selection and derives the masks applied to DATA and WEIGHT_SPECTRUM.
+    """
+    def __init__(self, table: casacore.tables.table,
+                 rows: Tuple[int, int], cells: Tuple[slice, ...]):
+        self.table = table
+        self.rows = rows
+        self.cells = cells
+
+    @functools.cached_property
+    def flag(self) -> np.ndarray:
+        return read_column(self.table, "FLAG", self.rows, self.cells)
+
+    @functools.cached_property
+    def flag_or_autocorr(self) -> np.ndarray:
+        antenna1 = read_column(self.table, "ANTENNA1", self.rows, ())
+        antenna2 = read_column(self.table, "ANTENNA2", self.rows, ())
+        return self.flag | (antenna1 == antenna2)[:, np.newaxis, np.newaxis]
+
+
+# CORR_TYPE values of the parallel hand correlations, linear (XX, YY)
+# then circular (RR, LL), see casacore Stokes::StokesTypes
+PARALLEL_HANDS = ((9, 12), (5, 8))
+
+
+def parallel_hands(table: casacore.tables.table) -> Tuple[int, int]:
+    """
+    Returns the correlation indices of the two parallel hands of the first
+    POLARIZATION row of a measurement set.
+    """
+    import casacore.tables
+    corr_type = list(casacore.tables.table(table.getkeyword("POLARIZATION"), readonly=True)
+                     .getcell("CORR_TYPE", 0))
+    for a, b in PARALLEL_HANDS:
+        if a in corr_type and b in corr_type:
+            return corr_type.index(a), corr_type.index(b)
+    raise DaliugeException(f"No parallel hand correlations in CORR_TYPE {corr_type}")
+
+
+def stokes_i_vis(vis: np.ndarray, flag: np.ndarray) -> np.ndarray:
+    """
+    Combines the parallel hands on the last axis of vis into Stokes I,
+    zeroing cells where either hand is flagged.
+    """
+    stokes = 0.5 * (vis[..., 0] + vis[..., -1])
+    stokes[flag[..., 0] | flag[..., -1]] = 0
+    return stokes
+
+
+def stokes_i_weight(weight: np.ndarray) -> np.ndarray:
+    """
+    Combines the parallel hand weights on the last axis of weight into the
+    weight of their Stokes I mean, 4 / (1 / wa + 1 / wb), which is 0 where
+    either weight is 0.
+    """
+    wa, wb = weight[..., 0], weight[..., -1]
+    total = wa + wb
+    return np.divide(4 * wa * wb, total, out=np.zeros_like(total), where=total != 0)
+
+
+def stokes_i_flag(flag: np.ndarray) -> np.ndarray:
+    return flag[..., 0] | flag[..., -1]
+
+
+def table_mtime(table_path: str) -> int:
+    """
+    Returns the latest modification time in ns of the files of a table and
+    its subtables, which changes whenever any of their contents do.
+    """
+    mtime = os.stat(table_path).st_mtime_ns
+    for root, _, files in os.walk(table_path):
+        for name in files:
+            # read only opens update the lock file
+            if name != "table.lock":
+                mtime = max(mtime, os.stat(os.path.join(root, name)).st_mtime_ns)
+    return mtime
 
-def numpy_to_drop(array: np.ndarray, drop):
-    buf = io.BytesIO()
-    np.save(buf, array)
-    drop.write(buf.getbuffer())
 
 @dataclass
 class PortOptions:
     table: casacore.tables.table
     name: str
-    dtype: str
-    rows: range
-    slicer: Tuple[slice]
+    dtype: Union[str, type]
+    rows: Tuple[int, int]
+    cells: Tuple[slice, ...]
+    # replaces the column read, for ports sharing a read with other ports
+    read: Optional[Callable[[], np.ndarray]] = None
+    # cells where mask() is True are set to 0
+    mask: Optional[Callable[[], np.ndarray]] = None
+    # reduces the pol axis after masking, e.g. to Stokes I
+    combine: Optional[Callable[[np.ndarray], np.ndarray]] = None
+
+    def read_masked(self) -> np.ndarray:
+        if self.read is not None:
+            data = self.read()
+        else:
+            data = read_column(self.table, self.name, self.rows, self.cells, self.dtype)
+        if self.mask is not None:
+            np.copyto(data, 0, where=self.mask())
+        return data
+
+    def read_data(self) -> np.ndarray:
+        data = self.read_masked()
+        if self.combine is not None:
+            data = self.combine(data)
+        return data
+
+
+def port_options(msm: casacore.tables.table, mssw: casacore.tables.table, masks: FlagMasks,
+                 taql_masking: bool, stokes: Optional[str], precision: str = "double") -> List[PortOptions]:
+    """
+    Returns the options of the MSReadApp output ports, in port order.
+    precision selects the dtypes of the visibility and weight ports, UVW
+    and CHAN_FREQ are always read in double precision.
+    """
+    row_range, cell_slice = masks.rows, masks.cells
+    chan_slice, pol_slice = cell_slice
+    real_dtype, complex_dtype = precision_dtypes(precision)
+    # table, name, dtype, rows, cells
+    if taql_masking:
+        portOptions = [
+            PortOptions(msm,  "UVW",                                                            "float64",     row_range,   ()),
+            PortOptions(mssw, "CHAN_FREQ",                                                      "float64",     (0, -1),     (chan_slice,)),
+            PortOptions(msm,  "REPLACEMASKED(DATA{cells}[FLAG{cells}||ANTENNA1==ANTENNA2], 0)", complex_dtype, row_range,   cell_slice),
+            PortOptions(msm,  "REPLACEMASKED(WEIGHT_SPECTRUM{cells}[FLAG{cells}], 0)",          real_dtype,    row_range,   cell_slice),
+            PortOptions(msm,  "FLAG",                                                           "bool",        row_range,   cell_slice),
+            PortOptions(msm,  "WEIGHT",                                                         real_dtype,    row_range,   (pol_slice,)),
+        ]
+    else:
+        portOptions = [
+            PortOptions(msm,  "UVW",             "float64",     row_range,   ()),
+            PortOptions(mssw, "CHAN_FREQ",       "float64",     (0, -1),     (chan_slice,)),
+            PortOptions(msm,  "DATA",            complex_dtype, row_range,   cell_slice, mask=lambda: masks.flag_or_autocorr),
+            PortOptions(msm,  "WEIGHT_SPECTRUM", real_dtype,    row_range,   cell_slice, mask=lambda: masks.flag),
+            PortOptions(msm,  "FLAG",            "bool",        row_range,   cell_slice, read=lambda: masks.flag),
+            PortOptions(msm,  "WEIGHT",          real_dtype,    row_range,   (pol_slice,)),
+        ]
+    if stokes:
+        portOptions[2].combine = lambda vis: stokes_i_vis(vis, masks.flag)
+        portOptions[3].combine = stokes_i_weight
+        portOptions[4].combine = stokes_i_flag
+        portOptions[5].combine = stokes_i_weight
+    return portOptions
+
+
+def read_port(opt: PortOptions, msm: casacore.tables.table, keep: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Reads the output array of a port, keeping only the rows where keep is
+    True of those indexed by main table row.
+    """
+    data = opt.read_data()
+    if keep is not None and opt.table is msm:
+        data = data[keep]
+    # columns are read in opt.dtype already
+    return data.squeeze()\
+        .astype(opt.dtype, copy=False)
+
+
+# process start methods that don't fork the caller, whose other threads,
+# e.g. those of the DALiuGE node manager, may hold casacore or ZMQ locks
+POOL_START_METHODS = ("forkserver", "spawn")
+
+
+def pool_executor(max_workers: int) -> Union[ProcessPoolExecutor, ThreadPoolExecutor]:
+    """
+    Returns a process pool of max_workers started with the first available
+    of POOL_START_METHODS, or a thread pool in daemonic processes, which
+    can't start children, and where no such start method exists.
+    """
+    if not multiprocessing.current_process().daemon:
+        for method in POOL_START_METHODS:
+            try:
+                context = multiprocessing.get_context(method)
+            except ValueError:
+                continue
+            return ProcessPoolExecutor(max_workers, mp_context=context)
+    return ThreadPoolExecutor(max_workers)
+
+
+def _read_port(index: int, ms_path: str, rows: Tuple[int, int], cells: Tuple[slice, ...],
+               taql_masking: bool, stokes: Optional[str], precision: str, keep: Optional[np.ndarray],
+               out_dir: Optional[str]):
+    """
+    Pool task reading the output of port index through its own table
+    handles. In a process pool the array is saved to a .npy file in out_dir,
+    whose path is returned, and returned directly otherwise.
+    """
+    import casacore.tables
+    msm = casacore.tables.table(ms_path, readonly=True, ack=False)
+    mssw = casacore.tables.table(msm.getkeyword("SPECTRAL_WINDOW"), readonly=True, ack=False)
+    try:
+        opt = port_options(msm, mssw, FlagMasks(msm, rows, cells), taql_masking, stokes, precision)[index]
+        data = read_port(opt, msm, keep)
+    finally:
+        mssw.close()
+        msm.close()
+    if out_dir is None:
+        return data
+    path = os.path.join(out_dir, f"{index}.npy")
+    np.save(path, data, allow_pickle=False)
+    return path
+
 
 ##
 # @brief MSReadApp
@@ -86,6 +975,28 @@ class PortOptions:
 #     \~English first pol to read
 # @param[in] param/pol_end pol_end/None/Integer/readwrite/False/
 #     \~English last pol to read
+# @param[in] param/chan_start chan_start/0/Integer/readwrite/False/
+#     \~English first channel to read
+# @param[in] param/chan_end chan_end/None/Integer/readwrite/False/
+#     \~English last channel to read
+# @param[in] param/taql_masking taql_masking/False/Bool/readwrite/False/
+#     \~English apply flags through TaQL expressions instead of reading FLAG once and masking in numpy
+# @param[in] param/chunk_rows chunk_rows//Integer/readwrite/False/
+#     \~English if set, read and stream outputs in blocks of this many rows
+# @param[in] param/compact_rows compact_rows/False/Bool/readwrite/False/
+#     \~English drop rows that are fully flagged, autocorrelations or of zero weight from all row indexed outputs
+# @param[in] param/stokes stokes//String/readwrite/False/
+#     \~English if set to I, combine the parallel hands into Stokes I at read time, ignoring pol_start and pol_end
+# @param[in] param/port_codecs port_codecs//String/readwrite/False/
+#     \~English wire codec per output port, e.g. vis=zlib,flag=bitpack, or one codec for all ports. One of raw, zlib, lzma, bitpack, or shm to pass arrays to consumers on the same node through shared memory
+# @param[in] param/precision precision/double/String/readwrite/False/
+#     \~English single (float32/complex64) or double (float64/complex128) precision vis, weight_spectrum and weight outputs
+# @param[in] param/read_workers read_workers/1/Integer/readwrite/False/
+#     \~English number of worker processes reading output ports concurrently, each with its own table handle. Not used with chunk_rows
+# @param[in] param/cache_dir cache_dir//String/readwrite/False/
+#     \~English if set, directory of an on-disk cache of the outputs keyed by the measurement set, its modification time and the selection, shareable between workers. Not used with chunk_rows
+# @param[in] param/cache_max_bytes cache_max_bytes//Integer/readwrite/False/
+#     \~English size limit of cache_dir, least recently used outputs are evicted beyond it
 # @param[in] port/ms ms/PathBasedDrop/
 #     \~English PathBasedDrop to a Measurement Set
 # @param[out] port/uvw uvw/ndarray/
@@ -110,42 +1021,279 @@ class MSReadApp(BarrierAppDROP):
     row_end = dlg_int_param('row_end', None)
     pol_start = dlg_int_param('pol_start', 0)
     pol_end = dlg_int_param('pol_end', None)
+    chan_start = dlg_int_param('chan_start', 0)
+    chan_end = dlg_int_param('chan_end', None)
+    taql_masking = dlg_bool_param('taql_masking', False)
+    chunk_rows = dlg_int_param('chunk_rows', None)
+    compact_rows = dlg_bool_param('compact_rows', False)
+    stokes = dlg_string_param('stokes', None)
+    port_codecs = dlg_string_param('port_codecs', None)
+    precision = dlg_string_param('precision', 'double')
+    read_workers = dlg_int_param('read_workers', 1)
+    cache_dir = dlg_string_param('cache_dir', None)
+    cache_max_bytes = dlg_int_param('cache_max_bytes', None)
+
+    # output port names, in port order, used to name the read phases
+    PORT_NAMES = ("uvw", "freq", "vis", "weight_spectrum", "flag", "weight")
+    WEIGHT_SPECTRUM = PORT_NAMES.index("weight_spectrum")
+    # parameters that only change how the outputs are read or written
+    CACHE_EXCLUDE_PARAMS = CACHE_EXCLUDE_PARAMS + ("port_codecs", "read_workers", "chunk_rows")
 
+    @instrumented
     def run(self):
         if len(self.inputs) < 1:
             raise DaliugeException(f"MSReadApp has {len(self.inputs)} input drops but requires at least 1")
         self.ms_path = self.inputs[0].path
         assert os.path.exists(self.ms_path)
-        assert casacore.tables.tableexists(self.ms_path)
-        msm = casacore.tables.table(self.ms_path, readonly=True)
-        mssw = casacore.tables.table(msm.getkeyword("SPECTRAL_WINDOW"), readonly=True)
-
+        codecs = parse_port_codecs(self.port_codecs, self.PORT_NAMES, self.portDtypes())
         if self.row_end == None:
             self.row_end = -1
-        row_range = (self.row_start, self.row_end)
-        
-        # (baseline, channels, pols)
-        tensor_slice = (slice(0, None), slice(0, None), slice(self.pol_start, self.pol_end))
 
-        # table, name, dtype, slicer
-        portOptions = [
-            PortOptions(msm,  "UVW",                                                "float64",    row_range,   tensor_slice[0]),
-            PortOptions(mssw, "CHAN_FREQ",                                          "float64",    (0, -1),     tensor_slice[1]),
-            PortOptions(msm,  "REPLACEMASKED(DATA[FLAG||ANTENNA1==ANTENNA2], 0)",   "complex128", row_range,   tensor_slice),
-            PortOptions(msm,  "REPLACEMASKED(WEIGHT_SPECTRUM[FLAG], 0)",            "float64",    row_range,   tensor_slice),
-            PortOptions(msm,  "FLAG",                                               "bool",       row_range,   tensor_slice),
-            PortOptions(msm,  "WEIGHT",                                             "float64",    row_range,   tensor_slice[0]),
-        ]
+        cache = None
+        if self.cache_dir and not self.chunk_rows:
+            portNames = self.PORT_NAMES[:len(self.outputs)]
+            cache = ResultCache(self.cache_dir, self.cache_max_bytes)
+            with phase("cache"):
+                # the parameters also select the column expressions read
+                key = cache_key(self, exclude=self.CACHE_EXCLUDE_PARAMS,
+                                ms=os.path.realpath(self.ms_path), mtime=table_mtime(self.ms_path))
+                cached = [cache.load(f"{key}.{name}") for name in portNames]
+            if all(data is not None for data in cached):
+                logger.debug("%s outputs loaded from cache entry %s", self.uid, key)
+                for name, outputDrop, data in zip(portNames, self.outputs, cached):
+                    numpy_to_drop(data, outputDrop, codec=codecs[name])
+                return
+
+        with phase("open"):
+            import casacore.tables
+            assert casacore.tables.tableexists(self.ms_path)
+            msm = casacore.tables.table(self.ms_path, readonly=True)
+            mssw = casacore.tables.table(msm.getkeyword("SPECTRAL_WINDOW"), readonly=True)
+
+        row_end = msm.nrows() if self.row_end < 0 else min(self.row_end, msm.nrows())
+        nrow = max(0, row_end - self.row_start)
+
+        # (channels, pols)
+        pol_slice = slice(self.pol_start, self.pol_end)
+        if self.stokes:
+            if self.stokes.upper() != "I":
+                raise DaliugeException(f"MSReadApp stokes {self.stokes} is not supported, only I")
+            # read only the two parallel hands
+            a, b = sorted(parallel_hands(msm))
+            pol_slice = slice(a, b + 1, b - a)
+        cell_slice = (slice(self.chan_start, self.chan_end), pol_slice)
+
+        if self.chunk_rows and nrow > 0:
+            if self.compact_rows:
+                raise DaliugeException("MSReadApp compact_rows is not supported together with chunk_rows")
+            if any(codec != RAW for codec in codecs.values()):
+                raise DaliugeException("MSReadApp port_codecs is not supported together with chunk_rows")
+            self.streamOutputs(msm, mssw, nrow, cell_slice)
+            return
+
+        masks = FlagMasks(msm, (self.row_start, nrow), cell_slice)
+        portOptions = self.makePortOptions(msm, mssw, masks)
+        keep = None
+        if self.compact_rows:
+            with phase("compact_rows"):
+                # rows with at least one unflagged cross correlation of nonzero weight
+                weight_spectrum = portOptions[self.WEIGHT_SPECTRUM].read_masked()
+                keep = live_rows(weight_spectrum, masks.flag_or_autocorr)
+            # the weight_spectrum port reuses this read
+            portOptions[self.WEIGHT_SPECTRUM] = replace(portOptions[self.WEIGHT_SPECTRUM],
+                                                        read=lambda: weight_spectrum, mask=None)
+            logger.debug("Dropping %d of %d rows without live visibilities", nrow - keep.sum(), nrow)
+        numPorts = min(len(portOptions), len(self.outputs))
+        if self.read_workers > 1 and numPorts > 1:
+            local = [self.WEIGHT_SPECTRUM] if keep is not None and numPorts > self.WEIGHT_SPECTRUM else []
+            ports = list(self.readPorts(msm, portOptions, local, keep))
+            # the workers open their own handles to the same tables
+            mssw.close()
+            msm.close()
+            ports = itertools.chain(ports, self.readPortsParallel(
+                [i for i in range(numPorts) if i not in local], masks.rows, cell_slice, keep))
+        else:
+            ports = self.readPorts(msm, portOptions, range(numPorts), keep)
+        for i, data in ports:
+            if cache is not None:
+                with phase("cache"):
+                    cache.store(f"{key}.{self.PORT_NAMES[i]}", data)
+            numpy_to_drop(data, self.outputs[i], codec=codecs[self.PORT_NAMES[i]])
+
+    def portDtypes(self) -> Dict[str, np.dtype]:
+        """
+        Returns the dtype of each output port by name, as read by port_options.
+        """
+        real_dtype, complex_dtype = precision_dtypes(self.precision)
+        dtypes = (np.float64, np.float64, complex_dtype, real_dtype, np.bool_, real_dtype)
+        return {name: np.dtype(dtype) for name, dtype in zip(self.PORT_NAMES, dtypes)}
+
+    def readPorts(self, msm, portOptions, indices, keep) -> Iterator[Tuple[int, np.ndarray]]:
+        for i in indices:
+            with phase(f"read_{self.PORT_NAMES[i]}"):
+                data = read_port(portOptions[i], msm, keep)
+            yield i, data
+
+    def readPortsParallel(self, indices, rows, cell_slice, keep) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Reads the ports at indices concurrently in a pool of read_workers
+        processes, each opening its own table handles, and yields them as
+        they complete so that the outputs are written while the remaining
+        ports are read. The workers hand arrays over as .npy files in a
+        temporary directory, in memory where /dev/shm exists, which are
+        memory mapped and unlinked.
+        """
+        pool = pool_executor(max(1, min(self.read_workers, len(indices))))
+        tmpdir = None
+        if isinstance(pool, ProcessPoolExecutor):
+            tmpdir = tempfile.TemporaryDirectory(prefix="msread-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        try:
+            out_dir = tmpdir.name if tmpdir is not None else None
+            with phase("read"), pool:
+                futures = {pool.submit(_read_port, i, self.ms_path, rows, cell_slice, self.taql_masking,
+                                       self.stokes, self.precision, keep, out_dir): i for i in indices}
+                try:
+                    for future in as_completed(futures):
+                        data = future.result()
+                        if out_dir is not None:
+                            path, data = data, np.load(data, mmap_mode="r")
+                            # the mapping outlives the file
+                            os.unlink(path)
+                        yield futures[future], data
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            if tmpdir is not None:
+                tmpdir.cleanup()
 
-        for i in range(len(portOptions)):
-            if len(self.outputs) >= i + 1:
-                outputDrop = self.outputs[i]
-                opt = portOptions[i]
-                data = opt.table.query(columns=f"{opt.name} as COL", offset=opt.rows[0], limit=opt.rows[1])\
-                    .getcol("COL")[opt.slicer]\
-                    .squeeze()\
-                    .astype(opt.dtype)
-                numpy_to_drop(data, outputDrop)
+    def streamOutputs(self, msm, mssw, nrow, cell_slice):
+        """
+        Reads chunk_rows rows at a time and appends each block to the
+        outputs as it is read, so that streaming consumers receive row
+        blocks while the read is in progress. Each output still holds a
+        single .npy array once complete.
+        """
+        row_end = self.row_start + nrow
+        for chunk_start in range(self.row_start, row_end, self.chunk_rows):
+            rows = (chunk_start, min(self.chunk_rows, row_end - chunk_start))
+            first = chunk_start == self.row_start
+            portOptions = self.makePortOptions(msm, mssw, FlagMasks(msm, rows, cell_slice))
+            for portName, outputDrop, opt in zip(self.PORT_NAMES, self.outputs, portOptions):
+                if opt.table is not msm:
+                    # not indexed by main table row, written once
+                    if first:
+                        numpy_to_drop(opt.read_data().squeeze().astype(opt.dtype, copy=False), outputDrop)
+                    continue
+                with phase(f"read_{portName}"):
+                    data = opt.read_data().astype(opt.dtype, copy=False)
+                start = time.perf_counter()
+                if first:
+                    shape = (nrow,) + data.shape[1:]
+                    write_npy_header(outputDrop, tuple(d for d in shape if d != 1), opt.dtype)
+                write_npy_data(outputDrop, data)
+                record_array("written", outputDrop, data, time.perf_counter() - start)
+
+    def makePortOptions(self, msm, mssw, masks: FlagMasks) -> List[PortOptions]:
+        return port_options(msm, mssw, masks, self.taql_masking, self.stokes, self.precision)
+
+
+# ioctl cloning a whole file into another on filesystems with copy on write
+# extents, e.g. btrfs and XFS
+FICLONE = 0x40049409
+
+COPY_MODES = ("copy", "reflink", "hardlink")
+
+
+def _unlink_target(dst: str):
+    """
+    Removes a file left at dst by an earlier copy. Writing through it
+    instead would truncate its source if it is a hard link.
+    """
+    try:
+        os.unlink(dst)
+    except FileNotFoundError:
+        pass
+
+
+def copy_file(src: str, dst: str):
+    _unlink_target(dst)
+    shutil.copy2(src, dst)
+
+
+def reflink_or_copy(src: str, dst: str):
+    """
+    Clones src to dst sharing its extents where the filesystem supports it,
+    which takes constant time and no space until either file is modified,
+    and copies it otherwise. An existing dst is replaced.
+    """
+    _unlink_target(dst)
+    try:
+        import fcntl
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+    except (ImportError, OSError):
+        shutil.copy2(src, dst)
+
+
+def link_or_copy(src: str, dst: str):
+    _unlink_target(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # e.g. across filesystems
+        reflink_or_copy(src, dst)
+
+
+def column_files(table_path: str, columns: Iterable[str]) -> Set[str]:
+    """
+    Returns the paths of the storage manager files of a table holding the
+    given columns. Columns sharing a storage manager share its files.
+    """
+    import casacore.tables
+    table = casacore.tables.table(table_path, readonly=True, ack=False)
+    try:
+        seqnrs = {table.getdminfo(column)["SEQNR"] for column in columns}
+    finally:
+        table.close()
+    patterns = [re.compile(rf"table\.f{seqnr}(?![0-9])") for seqnr in seqnrs]
+    return {os.path.join(table_path, name) for name in os.listdir(table_path)
+            if any(pattern.match(name) for pattern in patterns)}
+
+
+def copy_table(src: str, dst: str, mode: str, executor: ThreadPoolExecutor,
+               update_columns: Iterable[str] = ()) -> list:
+    """
+    Schedules a copy of the table directory src, with its subtables, to dst
+    on executor, returning the futures of the file copies.
+
+    copy copies every file and reflink clones them where supported. hardlink
+    shares storage manager files with src through hard links, except those
+    holding update_columns of the main table, which are cloned or copied
+    like the table metadata and lock files. Writes through dst to any
+    other column then also modify src.
+    """
+    if mode not in COPY_MODES:
+        raise DaliugeException(f"Unknown copy mode {mode}, expected one of {COPY_MODES}")
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise DaliugeException(f"Cannot copy table {src} onto itself")
+    private = column_files(src, update_columns) if mode == "hardlink" else set()
+    data_file = re.compile(r"table\.f[0-9]+")
+    futures = []
+    for root, _, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            path = os.path.join(root, name)
+            if mode == "copy":
+                copy = copy_file
+            elif mode == "hardlink" and data_file.match(name) and path not in private:
+                copy = link_or_copy
+            else:
+                copy = reflink_or_copy
+            futures.append(executor.submit(copy, path, os.path.join(target, name)))
+    return futures
 
 
 ##
@@ -157,8 +1305,14 @@ class MSReadApp(BarrierAppDROP):
 #     \~English Application class
 # @param[in] param/start_row start_row/0/Integer/readwrite/False/
 #     \~English start row to update tables from
-# @param[in] param/start_row start_row//Integer/readwrite/False/
+# @param[in] param/num_rows num_rows//Integer/readwrite/False/
 #     \~English number of table rows to update
+# @param[in] param/copy_mode copy_mode/reflink/String/readwrite/False/
+#     \~English copy, reflink to clone files on copy on write filesystems and copy elsewhere, or hardlink to share all storage manager files except those of the updated columns with the input
+# @param[in] param/copy_threads copy_threads/4/Integer/readwrite/False/
+#     \~English number of files copied concurrently across all outputs
+# @param[in] param/chunk_rows chunk_rows//Integer/readwrite/False/
+#     \~English rows written per putcol call, by default about 64 MiB rounded to whole tiles
 # @param[in] port/ms ms/PathBasedDrop/
 #     \~English PathBasedDrop of a Measurement Set
 # @param[in] port/vis vis/ndarray/
@@ -173,22 +1327,41 @@ class MSCopyUpdateApp(BarrierAppDROP):
                                    [dlg_streaming_input('binary/*')])
     start_row = dlg_int_param('start_row', 0)
     num_rows = dlg_int_param('num_rows', None)
+    copy_mode = dlg_string_param('copy_mode', 'reflink')
+    copy_threads = dlg_int_param('copy_threads', 4)
+    chunk_rows = dlg_int_param('chunk_rows', None)
+
+    # main table columns updated from the input ports following the ms port
+    UPDATE_COLUMNS = ["DATA"]
 
+    @instrumented
     def run(self):
         self.ms_path = self.inputs[0].path
         assert os.path.exists(self.ms_path)
+        import casacore.tables
         assert casacore.tables.tableexists(self.ms_path)
-        self.copyOutputs()
-        self.updateOutputs()
+        with phase("copy"):
+            self.copyOutputs()
+        with phase("update"):
+            self.updateOutputs()
 
     def copyOutputs(self):
+        """
+        Copies the input measurement set to every output, copying files
+        of all outputs concurrently.
+        """
         #self.copyRecursive(self.inputs[0])
-        for outputDrop in self.outputs:
-            cmd = f"cp -r {self.inputs[0].path} {outputDrop.path}"
-            os.system(cmd)
-        
+        update_columns = self.UPDATE_COLUMNS[:len(self.inputs) - 1]
+        with ThreadPoolExecutor(max(1, self.copy_threads)) as executor:
+            futures = []
+            for outputDrop in self.outputs:
+                futures += copy_table(self.inputs[0].path, outputDrop.path, self.copy_mode,
+                                      executor, update_columns)
+            for future in futures:
+                future.result()
 
     def updateOutputs(self):
+        import casacore.tables
         for outputDrop in self.outputs:
             msm = casacore.tables.table(outputDrop.path, readonly=False)  # main table
             mssw = casacore.tables.table(msm.getkeyword("SPECTRAL_WINDOW"), readonly=True)
@@ -206,7 +1379,8 @@ class MSCopyUpdateApp(BarrierAppDROP):
                 name = portOptions[i][1]
                 data = drop_to_numpy(inputDrop)
                 num_rows = data.shape[0] if self.num_rows is None else self.num_rows
-                table.col(name).putcol(data, startrow=self.start_row, nrow=num_rows)
+                write_column(table, name, data[:num_rows], self.start_row, self.chunk_rows)
+            msm.close()
 
     def copyRecursive(self, inputDrop):
         if isinstance(inputDrop, ContainerDROP):
@@ -224,6 +1398,8 @@ class MSCopyUpdateApp(BarrierAppDROP):
 # @param category PythonApp
 # @param[in] param/appclass appclass/daliuge_component_nifty.ms.MsUpdateApp/String/readonly/False/
 #     \~English Application class
+# @param[in] param/chunk_rows chunk_rows//Integer/readwrite/False/
+#     \~English rows written per putcol call, by default about 64 MiB rounded to whole tiles
 # @param[in] port/ms ms/PathBasedDrop/
 #     \~English PathBasedDrop of a Measurement Set
 # @param[in] port/vis vis/ndarray/
@@ -234,14 +1410,19 @@ class MSUpdateApp(BarrierAppDROP):
                                    [dlg_batch_input('binary/*', [])],
                                    [dlg_batch_output('binary/*', [])],
                                    [dlg_streaming_input('binary/*')])
+    chunk_rows = dlg_int_param('chunk_rows', None)
 
+    @instrumented
     def run(self):
         self.ms_path = self.inputs[0].path
         assert os.path.exists(self.ms_path)
+        import casacore.tables
         assert casacore.tables.tableexists(self.ms_path)
-        self.updateOutputs()
+        with phase("update"):
+            self.updateOutputs()
 
     def updateOutputs(self):
+        import casacore.tables
         msm = casacore.tables.table(self.inputs[0].path, readonly=False)  # main table
         mssw = casacore.tables.table(msm.getkeyword("SPECTRAL_WINDOW"), readonly=True)
 
@@ -257,4 +1438,5 @@ class MSUpdateApp(BarrierAppDROP):
             table = portOptions[i][0]
             name = portOptions[i][1]
             data = drop_to_numpy(inputDrop)
-            table.col(name).putcol(data)
+            write_column(table, name, data, chunk_rows=self.chunk_rows)
+        msm.close()
@@ -25,10 +25,10 @@ import logging
 
 import time
 import numpy as np
-from matplotlib import pyplot as plt
 from dataclasses import dataclass, astuple
 from typing import Optional, Tuple
 
+from daliuge_component_nifty.metrics import instrumented, phase
 from daliuge_component_nifty.ms import drop_to_numpy
 
 from dlg import droputils, utils
@@ -66,10 +66,14 @@ class ImagePlotApp(BarrierAppDROP):
                                    [dlg_streaming_input('binary/*')])
     title = dlg_string_param("title", "image")
 
+    @instrumented
     def run(self):
-        plt.gray()
-        plt.imshow(drop_to_numpy(self.inputs[0]))
-        plt.colorbar()
-        plt.title(self.title)
-        plt.savefig(self.outputs[0], format='png')
-        plt.close()
+        image = drop_to_numpy(self.inputs[0])
+        with phase("plot"):
+            from matplotlib import pyplot as plt
+            plt.gray()
+            plt.imshow(image)
+            plt.colorbar()
+            plt.title(self.title)
+            plt.savefig(self.outputs[0], format='png')
+            plt.close()
@@ -0,0 +1,114 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#    MA  02110-1301, USA.
+
+import logging
+from typing import List
+
+import numpy as np
+
+from daliuge_component_nifty.metrics import instrumented, phase
+from daliuge_component_nifty.ms import drop_to_numpy, numpy_to_drop
+from dlg.exceptions import DaliugeException
+from dlg.drop import BarrierAppDROP, DataDROP, InMemoryDROP
+from dlg.meta import (dlg_batch_input, dlg_batch_output, dlg_component,
+                      dlg_int_param, dlg_streaming_input)
+
+logger = logging.getLogger(__name__)
+
+
+##
+# @brief ReduceImagesApp
+# @details Sums any number of partial images, e.g. dirty images gridded from
+# different row ranges of a measurement set. Inputs are added one at a time into
+# a single accumulator so memory stays at one image plus one input view.
+# To reduce many partitions in a tree, place the app in a Gather construct whose
+# num_of_inputs equals fan_in and chain one Gather per level, each level's image
+# outputs feeding the next, until a single app remains; reduce_images_tree builds
+# the same tree from Python.
+# @par EAGLE_START
+# @param category PythonApp
+# @param[in] param/appclass appclass/daliuge_component_nifty.ReduceImagesApp/String/readonly/False/
+#     \~English Application class
+# @param[in] param/fan_in fan_in/0/Integer/readwrite/False/
+#     \~English maximum number of input images per app, 0 for any number
+# @param[in] port/image image/ndarray/
+#     \~English partial image ports, all of the same shape
+# @param[out] port/image image/ndarray/
+#     \~English summed image port
+# @par EAGLE_END
+class ReduceImagesApp(BarrierAppDROP):
+    component_meta = dlg_component('ReduceImagesApp', 'Image Sum Reduction App.',
+                                    [dlg_batch_input('binary/*', [])],
+                                    [dlg_batch_output('binary/*', [])],
+                                    [dlg_streaming_input('binary/*')])
+    fan_in = dlg_int_param('fan_in', 0)
+
+    @instrumented
+    def run(self):
+        if len(self.inputs) < 1:
+            raise DaliugeException(f"ReduceImagesApp has {len(self.inputs)} input drops but requires at least 1")
+        if self.fan_in > 0 and len(self.inputs) > self.fan_in:
+            raise DaliugeException(f"ReduceImagesApp has {len(self.inputs)} input drops but fan_in is {self.fan_in}")
+        image = drop_to_numpy(self.inputs[0], writable=True)
+        for inputDrop in self.inputs[1:]:
+            partial = drop_to_numpy(inputDrop)
+            if partial.shape != image.shape:
+                raise DaliugeException(f"ReduceImagesApp input {inputDrop.uid} has shape {partial.shape}, expected {image.shape}")
+            with phase("sum"):
+                np.add(image, partial, out=image, casting="same_kind")
+            del partial
+
+        numpy_to_drop(image, self.outputs[0])
+
+
+def reduce_images_tree(images: List[DataDROP], fan_in: int = 0, prefix: str = "reduce") -> DataDROP:
+    """
+    Connects ReduceImagesApp instances summing images in a tree where each
+    app sums at most fan_in drops, giving a reduction of depth
+    ceil(log(len(images), fan_in)). A fan_in of 0 sums all images in a single
+    app. Returns the drop receiving the total, which is images[0] itself if
+    there is a single image.
+    """
+    if fan_in == 0:
+        fan_in = max(len(images), 2)
+    if fan_in < 2:
+        raise DaliugeException(f"fan_in must be 0 or at least 2, got {fan_in}")
+    if not images:
+        raise DaliugeException("reduce_images_tree requires at least 1 image")
+    level = list(images)
+    depth = 0
+    while len(level) > 1:
+        next_level = []
+        for start in range(0, len(level), fan_in):
+            group = level[start:start + fan_in]
+            if len(group) == 1:
+                next_level.append(group[0])
+                continue
+            uid = f"{prefix}_{depth}_{start // fan_in}"
+            app = ReduceImagesApp(uid, uid, fan_in=fan_in)
+            output = InMemoryDROP(f"{uid}_image", f"{uid}_image")
+            for image in group:
+                app.addInput(image)
+            app.addOutput(output)
+            next_level.append(output)
+        level = next_level
+        depth += 1
+    return level[0]
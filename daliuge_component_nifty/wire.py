@@ -0,0 +1,267 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2017
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#    MA  02110-1301, USA.
+"""
+Encoded wire format for arrays passed between drops.
+
+Arrays written with the default "raw" codec are plain .npy files. Other
+codecs write a self-describing file that readers recognise by its magic:
+
+    WIRE_MAGIC, version byte, uint32 LE header length, JSON header, payload
+
+where the header holds the codec name, the dtype string and the shape, and
+the payload is the encoded C order array data. Codecs are looked up by
+name in CODECS, to which register_codec adds new ones.
+
+The "shm" transport writes the same header with the name of a shared
+memory segment holding the array and no payload, see
+daliuge_component_nifty.ms.share_array.
+"""
+
+import abc
+import json
+import lzma
+import struct
+import zlib
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from dlg.exceptions import DaliugeException
+
+WIRE_MAGIC = b"\x93NIFTY"
+WIRE_VERSION = 1
+RAW = "raw"
+SHM = "shm"
+
+_HEADER_LEN = struct.Struct("<I")
+
+
+def c_order_chunks(array: np.ndarray, chunk_size: int) -> Iterator[memoryview]:
+    """
+    Yields the bytes of array in C order, in chunks of at most chunk_size
+    bytes for contiguous arrays and of whole leading axis rows otherwise.
+    """
+    if array.flags.c_contiguous:
+        data = memoryview(array.reshape(-1).view(np.uint8))
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+    else:
+        # copy one block of leading axis rows at a time
+        rows = max(1, chunk_size // max(1, array[0].nbytes))
+        for start in range(0, array.shape[0], rows):
+            block = np.ascontiguousarray(array[start:start + rows])
+            yield memoryview(block.reshape(-1).view(np.uint8))
+
+
+class Codec(abc.ABC):
+    """
+    Encodes array data into a byte stream and decodes it back into a
+    preallocated C contiguous array. check raises DaliugeException for
+    dtypes the codec can't encode.
+    """
+    def check(self, dtype: np.dtype):
+        pass
+
+    @abc.abstractmethod
+    def encode(self, array: np.ndarray, chunk_size: int) -> Iterator[bytes]:
+        pass
+
+    @abc.abstractmethod
+    def decode(self, payload: memoryview, out: np.ndarray, chunk_size: int):
+        pass
+
+
+class ZlibCodec(Codec):
+    def __init__(self, level: int = 1):
+        self.level = level
+
+    def encode(self, array, chunk_size):
+        compressor = zlib.compressobj(self.level)
+        for chunk in c_order_chunks(array, chunk_size):
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+
+    def decode(self, payload, out, chunk_size):
+        target = memoryview(out.reshape(-1).view(np.uint8))
+        decompressor = zlib.decompressobj()
+        pos = 0
+        for start in range(0, len(payload), chunk_size):
+            data = payload[start:start + chunk_size]
+            while data:
+                # max_length bounds the memory of highly compressed runs
+                block = decompressor.decompress(data, chunk_size)
+                target[pos:pos + len(block)] = block
+                pos += len(block)
+                data = decompressor.unconsumed_tail
+        block = decompressor.flush()
+        target[pos:pos + len(block)] = block
+
+
+class LzmaCodec(Codec):
+    def __init__(self, preset: int = 1):
+        self.preset = preset
+
+    def encode(self, array, chunk_size):
+        compressor = lzma.LZMACompressor(preset=self.preset)
+        for chunk in c_order_chunks(array, chunk_size):
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+
+    def decode(self, payload, out, chunk_size):
+        target = memoryview(out.reshape(-1).view(np.uint8))
+        decompressor = lzma.LZMADecompressor()
+        pos = 0
+        for start in range(0, len(payload), chunk_size):
+            data = payload[start:start + chunk_size]
+            while True:
+                block = decompressor.decompress(data, chunk_size)
+                target[pos:pos + len(block)] = block
+                pos += len(block)
+                data = b""
+                if decompressor.eof or decompressor.needs_input:
+                    break
+
+
+class BitpackCodec(Codec):
+    """
+    Packs boolean arrays, e.g. FLAG, into one bit per element.
+    """
+    def check(self, dtype):
+        if dtype != np.bool_:
+            raise DaliugeException(f"bitpack codec requires a bool array, got {dtype}")
+
+    def encode(self, array, chunk_size):
+        flat = np.ascontiguousarray(array).reshape(-1)
+        # whole bytes of bits per chunk
+        step = max(8, chunk_size - chunk_size % 8)
+        for start in range(0, len(flat), step):
+            yield np.packbits(flat[start:start + step]).data
+
+    def decode(self, payload, out, chunk_size):
+        flat = out.reshape(-1).view(np.uint8)
+        for start in range(0, len(payload), chunk_size):
+            bits = np.unpackbits(np.frombuffer(payload[start:start + chunk_size], dtype=np.uint8))
+            first = start * 8
+            count = min(len(bits), len(flat) - first)
+            flat[first:first + count] = bits[:count]
+
+
+CODECS: Dict[str, Codec] = {
+    "zlib": ZlibCodec(),
+    "lzma": LzmaCodec(),
+    "bitpack": BitpackCodec(),
+}
+
+
+def register_codec(name: str, codec: Codec):
+    if name in (RAW, SHM):
+        raise DaliugeException(f"Codec name {name} is reserved")
+    if not isinstance(codec, Codec):
+        raise DaliugeException(f"Codec {name} must be a Codec instance, got {type(codec).__name__}")
+    CODECS[name] = codec
+
+
+def get_codec(name: str) -> Codec:
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise DaliugeException(f"Unknown codec {name}, expected one of {[RAW, SHM] + list(CODECS)}") from None
+
+
+def parse_port_codecs(spec: Optional[str], port_names: Iterable[str],
+                      port_dtypes: Optional[Dict[str, np.dtype]] = None) -> Dict[str, str]:
+    """
+    Parses a per port codec selection such as "vis=zlib,flag=bitpack" into
+    a codec name per port, "raw" for unlisted ports. A bare codec name
+    applies to all ports. Given the dtype of each port, the selected codecs
+    are checked against them before any array is written.
+    """
+    port_names = list(port_names)
+    codecs = {name: RAW for name in port_names}
+    if not spec:
+        return codecs
+    for item in spec.split(","):
+        port, sep, codec = (part.strip() for part in item.partition("="))
+        if not sep:
+            port, codec = "*", port
+        if codec not in (RAW, SHM):
+            get_codec(codec)
+        if port == "*":
+            codecs = {name: codec for name in port_names}
+        elif port in codecs:
+            codecs[port] = codec
+        else:
+            raise DaliugeException(f"Unknown port {port} in codecs {spec}, expected one of {port_names}")
+    for name, codec in codecs.items():
+        if port_dtypes is not None and codec not in (RAW, SHM):
+            try:
+                get_codec(codec).check(np.dtype(port_dtypes[name]))
+            except DaliugeException as e:
+                raise DaliugeException(f"Codec {codec} can't encode port {name}: {e}") from None
+    return codecs
+
+
+def is_encoded(buf) -> bool:
+    return bytes(buf[:len(WIRE_MAGIC)]) == WIRE_MAGIC
+
+
+def encode_header(codec: str, array: np.ndarray, **fields) -> bytes:
+    header = json.dumps(dict(fields, codec=codec, dtype=array.dtype.str, shape=list(array.shape))).encode()
+    return WIRE_MAGIC + bytes([WIRE_VERSION]) + _HEADER_LEN.pack(len(header)) + header
+
+
+def read_header(buf: memoryview) -> Tuple[dict, int]:
+    """
+    Returns the header of an encoded buffer and the offset of its payload.
+    """
+    version = buf[len(WIRE_MAGIC)]
+    if version != WIRE_VERSION:
+        raise DaliugeException(f"Unsupported wire format version {version}")
+    offset = len(WIRE_MAGIC) + 1
+    (length,) = _HEADER_LEN.unpack_from(buf, offset)
+    offset += _HEADER_LEN.size
+    return json.loads(bytes(buf[offset:offset + length])), offset + length
+
+
+def write_encoded(array: np.ndarray, drop, codec: str, chunk_size: int):
+    """
+    Writes array into drop with the named codec, streaming the encoded
+    data in chunks.
+    """
+    encoder = get_codec(codec)
+    if array.dtype.hasobject or array.dtype.names is not None:
+        raise DaliugeException(f"codec {codec} does not support dtype {array.dtype}")
+    encoder.check(array.dtype)
+    drop.write(encode_header(codec, array))
+    for block in encoder.encode(array, chunk_size):
+        if len(block):
+            drop.write(memoryview(block))
+
+
+def decode(buf, chunk_size: int) -> np.ndarray:
+    """
+    Decodes a buffer written by write_encoded into a new array.
+    """
+    buf = memoryview(buf).cast("B")
+    header, offset = read_header(buf)
+    out = np.empty(header["shape"], dtype=np.dtype(header["dtype"]))
+    get_codec(header["codec"]).decode(buf[offset:], out, chunk_size)
+    return out
@@ -12,3 +12,39 @@ def go_to_tmpdir(request):
     # Chdir only for the duration of the test.
     with tmpdir.as_cwd():
         yield
+
+
+@pytest.fixture
+def ms_path(tmpdir):
+    """Path to a small synthetic MeasurementSet with 4 channels and 4 pols"""
+    import numpy as np
+    import casacore.tables
+
+    num_rows, num_chan, num_pol = 20, 4, 4
+    path = str(tmpdir / "synthetic.ms")
+    desc = casacore.tables.maketabdesc([
+        casacore.tables.makearrcoldesc("DATA", 0j, shape=[num_chan, num_pol]),
+        casacore.tables.makearrcoldesc("WEIGHT_SPECTRUM", 0.0, shape=[num_chan, num_pol]),
+    ])
+    rng = np.random.default_rng(42)
+    msm = casacore.tables.default_ms(path, desc)
+    msm.addrows(num_rows)
+    msm.putcol("UVW", rng.normal(size=(num_rows, 3)) * 100)
+    msm.putcol("ANTENNA1", np.arange(num_rows) % 3)
+    msm.putcol("ANTENNA2", np.arange(num_rows) % 5 % 3)
+    msm.putcol("DATA", rng.normal(size=(num_rows, num_chan, num_pol)) + 1j)
+    msm.putcol("WEIGHT_SPECTRUM", rng.uniform(size=(num_rows, num_chan, num_pol)))
+    msm.putcol("FLAG", rng.uniform(size=(num_rows, num_chan, num_pol)) < 0.3)
+    msm.putcol("WEIGHT", rng.uniform(size=(num_rows, num_pol)))
+    mssw = casacore.tables.table(msm.getkeyword("SPECTRAL_WINDOW"), readonly=False, ack=False)
+    mssw.addrows(1)
+    mssw.putcell("CHAN_FREQ", 0, np.linspace(1e8, 2e8, num_chan))
+    mssw.close()
+    mspol = casacore.tables.table(msm.getkeyword("POLARIZATION"), readonly=False, ack=False)
+    mspol.addrows(1)
+    mspol.putcell("NUM_CORR", 0, num_pol)
+    # XX, XY, YX, YY
+    mspol.putcell("CORR_TYPE", 0, np.array([9, 10, 11, 12]))
+    mspol.close()
+    msm.close()
+    return path
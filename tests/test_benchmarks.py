@@ -0,0 +1,20 @@
+import copy
+import json
+
+from benchmarks import run
+
+
+def test_benchmarks_tiny(tmpdir):
+    output = str(tmpdir / "bench.json")
+    assert run.main(["--scale", "tiny", "--repeat", "1", "--output", output]) == 0
+    with open(output) as f:
+        report = json.load(f)
+    assert set(report["results"]) == set(run.CASES)
+    for result in report["results"].values():
+        assert result["wall_s"] > 0
+        assert result["throughput"] > 0
+
+    assert run.compare(report, report, 0.2) == []
+    slower = copy.deepcopy(report)
+    slower["results"]["MS2DirtyApp"]["wall_s"] *= 2
+    assert len(run.compare(slower, report, 0.2)) == 1
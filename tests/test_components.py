@@ -1,10 +1,20 @@
+import os
+import unittest
+
 import pytest
 import numpy as np
+import ducc0
 
 from dlg.exceptions import DaliugeException
-from daliuge_component_nifty import MS2DirtyApp, CudaMS2DirtyApp, CudaDirty2MSApp
-from daliuge_component_nifty.ms import MSReadApp, numpy_to_drop
+from daliuge_component_nifty import MS2DirtyApp, StreamingMS2DirtyApp, Dirty2MSApp, CudaMS2DirtyApp, CudaDirty2MSApp
+from daliuge_component_nifty import cpu_gridder, ms
+from daliuge_component_nifty.cache import ResultCache
+from daliuge_component_nifty.metrics import set_metrics_sink
+from daliuge_component_nifty.reduce import ReduceImagesApp, reduce_images_tree
+from daliuge_component_nifty.ms import MSReadApp, drop_to_numpy, numpy_to_drop, write_npy_header, write_npy_data
+from dlg.ddap_protocol import AppDROPStates, DROPStates
 from dlg.drop import InMemoryDROP
+from dlg.droputils import DROPWaiterCtx
 
 given = pytest.mark.parametrize
 
@@ -63,6 +73,382 @@ def test_MS2DirtyApp():
     app.run()
 
 
+def _array_drop(name, array):
+    drop = InMemoryDROP(name, name)
+    numpy_to_drop(array, drop)
+    return drop
+
+
+@given("precision, epsilon, dtype", [("double", 1e-6, np.float64), ("single", 1e-5, np.float32)])
+def test_MS2DirtyApp_precision(precision, epsilon, dtype):
+    rng = np.random.default_rng(0)
+    uvw = rng.uniform(-32, 32, size=(16, 3))
+    freq = np.array([299792458.0, 299792459.0])
+    vis = rng.normal(size=(16, 2)) + 1j * rng.normal(size=(16, 2))
+    weight_spectrum = np.ones((16, 2))
+
+    app = MS2DirtyApp("a", "a", precision=precision, epsilon=epsilon, nthreads=0)
+    for name, array in zip(["uvw", "freq", "vis", "weight_spectrum"], [uvw, freq, vis, weight_spectrum]):
+        app.addInput(_array_drop(name, array))
+    image_drop = InMemoryDROP("image", "image")
+    app.addOutput(image_drop)
+    app.run()
+    image = drop_to_numpy(image_drop)
+    assert image.dtype == dtype
+
+    app = Dirty2MSApp("b", "b", precision=precision, epsilon=epsilon, nthreads=2)
+    for name, array in zip(["uvw", "freq", "image", "weight_spectrum"], [uvw, freq, image, weight_spectrum]):
+        app.addInput(_array_drop(name, array))
+    vis_drop = InMemoryDROP("vis", "vis")
+    app.addOutput(vis_drop)
+    app.run()
+    assert drop_to_numpy(vis_drop).shape == vis.shape
+
+
+@given("weight_pols", [True, False])
+def test_MS2DirtyApp_cube(weight_pols):
+    rng = np.random.default_rng(0)
+    uvw = rng.uniform(-32, 32, size=(16, 3))
+    freq = np.array([299792458.0, 299792459.0])
+    vis = rng.normal(size=(16, 2, 4)) + 1j * rng.normal(size=(16, 2, 4))
+    weight_spectrum = rng.uniform(size=(16, 2, 4) if weight_pols else (16, 2))
+
+    app = MS2DirtyApp("a", "a", nthreads=4)
+    for name, array in zip(["uvw", "freq", "vis", "weight_spectrum"], [uvw, freq, vis, weight_spectrum]):
+        app.addInput(_array_drop(name, array))
+    image_drop = InMemoryDROP("image", "image")
+    app.addOutput(image_drop)
+    app.run()
+
+    image = drop_to_numpy(image_drop)
+    assert image.shape == (4, 64, 64)
+    for pol in range(4):
+        weights = weight_spectrum[:, :, pol] if weight_pols else weight_spectrum
+        expected = ducc0.wgridder.ms2dirty(uvw, freq, vis[:, :, pol], weights,
+            npix_x=64, npix_y=64, pixsize_x=1.0 / 64, pixsize_y=1.0 / 64,
+            epsilon=1e-6, do_wstacking=True)
+        assert np.allclose(image[pol], expected)
+
+
+@given("vis_shape", [(16, 5), (16, 5, 2)])
+@given("daemon", [False, True])
+def test_MS2DirtyApp_chan_block_size(monkeypatch, vis_shape, daemon):
+    # daemonic processes grid in threads without copying into shared memory
+    monkeypatch.setattr(ms.multiprocessing, "current_process", lambda: type("Process", (), {"daemon": daemon}))
+    if daemon:
+        monkeypatch.setattr(cpu_gridder.SharedArray, "create", None)
+    rng = np.random.default_rng(0)
+    uvw = rng.uniform(-32, 32, size=(16, 3))
+    freq = np.linspace(299792458.0, 299792462.0, 5)
+    vis = rng.normal(size=vis_shape) + 1j * rng.normal(size=vis_shape)
+    weight_spectrum = rng.uniform(size=vis_shape)
+    arrays = [uvw, freq, vis, weight_spectrum]
+
+    images = []
+    for params in [{}, {"chan_block_size": 2, "nthreads": 3}]:
+        app = MS2DirtyApp("a", "a", **params)
+        for name, array in zip(["uvw", "freq", "vis", "weight_spectrum"], arrays):
+            app.addInput(_array_drop(name, array))
+        image_drop = InMemoryDROP("image", "image")
+        app.addOutput(image_drop)
+        app.run()
+        images.append(drop_to_numpy(image_drop))
+    assert images[0].shape == images[1].shape
+    assert np.allclose(images[0], images[1], atol=1e-5 * np.abs(images[0]).max())
+
+
+def test_MS2DirtyApp_chan_block_size_single_worker(monkeypatch):
+    rng = np.random.default_rng(0)
+    arrays = [rng.uniform(-32, 32, size=(16, 3)), np.linspace(299792458.0, 299792462.0, 5),
+              rng.normal(size=(16, 5, 2)) + 0j, rng.uniform(size=(16, 5, 2))]
+    images = []
+    for params in [{}, {"chan_block_size": 2}]:
+        app = MS2DirtyApp("a", "a", **params)
+        for name, array in zip(["uvw", "freq", "vis", "weight_spectrum"], arrays):
+            app.addInput(_array_drop(name, array))
+        image_drop = InMemoryDROP("image", "image")
+        app.addOutput(image_drop)
+        # one worker grids the blocks in this thread, without a pool or shared copies
+        monkeypatch.setattr(cpu_gridder, "pool_executor", None)
+        monkeypatch.setattr(cpu_gridder.SharedArray, "create", None)
+        app.run()
+        images.append(drop_to_numpy(image_drop))
+    assert images[0].shape == images[1].shape == (2, 64, 64)
+    assert np.allclose(images[0], images[1], atol=1e-5 * np.abs(images[0]).max())
+
+
+def test_MS2DirtyApp_metrics():
+    rng = np.random.default_rng(0)
+    arrays = [rng.uniform(-32, 32, size=(16, 3)), np.array([299792458.0]),
+              rng.normal(size=(16, 1)) + 0j, np.ones((16, 1))]
+    records = []
+    set_metrics_sink(records.append)
+    try:
+        app = MS2DirtyApp("a", "a")
+        for name, array in zip(["uvw", "freq", "vis", "weight_spectrum"], arrays):
+            app.addInput(_array_drop(name, array))
+        app.addOutput(InMemoryDROP("image", "image"))
+        app.run()
+    finally:
+        set_metrics_sink(None)
+
+    record, = records
+    assert record["app"] == "MS2DirtyApp"
+    assert set(record["phases"]) == {"prepare", "grid"}
+    assert record["bytes_read"] == sum(array.nbytes for array in arrays)
+    assert record["bytes_written"] == 64 * 64 * 8
+    assert [a["shape"] for a in record["arrays"]] == [list(a.shape) for a in arrays] + [[64, 64]]
+    assert record["peak_rss_bytes"] > 0
+
+
+def test_MS2DirtyApp_cache(tmpdir, monkeypatch):
+    rng = np.random.default_rng(0)
+    uvw = rng.uniform(-32, 32, size=(16, 3))
+    freq = np.array([299792458.0, 299792459.0])
+    vis = rng.normal(size=(16, 2)) + 1j * rng.normal(size=(16, 2))
+    weight_spectrum = rng.uniform(size=(16, 2))
+    cache_dir = str(tmpdir / "cache")
+
+    calls = []
+    ms2dirty = ducc0.wgridder.ms2dirty
+    monkeypatch.setattr(ducc0.wgridder, "ms2dirty", lambda *args, **kwargs: calls.append(1) or ms2dirty(*args, **kwargs))
+
+    def run(vis, **params):
+        app = MS2DirtyApp("a", "a", cache_dir=cache_dir, **params)
+        for name, array in zip(["uvw", "freq", "vis", "weight_spectrum"], [uvw, freq, vis, weight_spectrum]):
+            app.addInput(_array_drop(name, array))
+        image_drop = InMemoryDROP("image", "image")
+        app.addOutput(image_drop)
+        app.run()
+        return drop_to_numpy(image_drop)
+
+    image = run(vis)
+    assert len(calls) == 1
+    assert np.array_equal(run(vis, nthreads=2), image)
+    assert len(calls) == 1
+    run(vis, epsilon=1e-5)
+    assert len(calls) == 2
+    changed = vis.copy()
+    changed[0, 0] += 1
+    run(changed)
+    assert len(calls) == 3
+    assert len(tmpdir.join("cache").listdir()) == 3
+
+    app = Dirty2MSApp("b", "b", cache_dir=cache_dir)
+    for name, array in zip(["uvw", "freq", "image", "weight_spectrum"], [uvw, freq, image, weight_spectrum]):
+        app.addInput(_array_drop(name, array))
+    vis_drop = InMemoryDROP("vis", "vis")
+    app.addOutput(vis_drop)
+    app.run()
+    assert len(tmpdir.join("cache").listdir()) == 4
+
+
+def test_ResultCache_eviction(tmpdir):
+    cache = ResultCache(str(tmpdir), max_bytes=3 * (128 + 800))
+    for i in range(3):
+        cache.store(f"k{i}", np.full(100, i, dtype=np.float64))
+    # refresh k0 so that k1 is the least recently used
+    os.utime(cache.path("k1"), (0, 0))
+    assert cache.load("k0")[0] == 0
+    cache.store("k3", np.zeros(100))
+    assert cache.load("k1") is None
+    for key in ["k0", "k2", "k3"]:
+        assert cache.load(key) is not None
+    assert not [name for name in os.listdir(str(tmpdir)) if name.endswith(".tmp")]
+
+
+def test_MS2DirtyApp_compact_rows():
+    rng = np.random.default_rng(0)
+    uvw = rng.uniform(-32, 32, size=(16, 3))
+    freq = np.array([299792458.0, 299792459.0])
+    vis = rng.normal(size=(16, 2)) + 1j * rng.normal(size=(16, 2))
+    weight_spectrum = rng.uniform(size=(16, 2))
+    weight_spectrum[::3] = 0
+    arrays = [uvw, freq, vis, weight_spectrum]
+
+    images = []
+    for compact_rows in [False, True]:
+        app = MS2DirtyApp("a", "a", compact_rows=compact_rows)
+        for name, array in zip(["uvw", "freq", "vis", "weight_spectrum"], arrays):
+            app.addInput(_array_drop(name, array))
+        image_drop = InMemoryDROP("image", "image")
+        app.addOutput(image_drop)
+        app.run()
+        images.append(drop_to_numpy(image_drop))
+    assert np.allclose(images[0], images[1], atol=1e-5 * np.abs(images[0]).max())
+
+
+def test_StreamingMS2DirtyApp():
+    app = StreamingMS2DirtyApp("a", "a")
+
+    num_rows = 40
+    num_chan = 3
+    rng = np.random.default_rng(0)
+    uvw = rng.uniform(-32, 32, size=(num_rows, 3))
+    freq = np.linspace(299792458.0, 299792460.0, num_chan)
+    vis = rng.normal(size=(num_rows, num_chan)) + 1j * rng.normal(size=(num_rows, num_chan))
+    weight_spectrum = rng.uniform(size=(num_rows, num_chan))
+
+    arrays = [uvw, freq, vis, weight_spectrum]
+    drops = [InMemoryDROP(name, name) for name in ["uvw", "freq", "vis", "weight_spectrum"]]
+    for drop in drops:
+        app.addStreamingInput(drop)
+    image_drop = InMemoryDROP("image", "image")
+    app.addOutput(image_drop)
+
+    # interleave row blocks across ports like a chunked MSReadApp
+    for drop, array in zip(drops, arrays):
+        write_npy_header(drop, array.shape, array.dtype)
+    write_npy_data(drops[1], freq)
+    for start in range(0, num_rows, 7):
+        for drop, array in zip(drops, arrays):
+            if array is not freq:
+                write_npy_data(drop, array[start:start + 7], chunk_size=5)
+    for drop in drops:
+        app.dropCompleted(drop.uid, DROPStates.COMPLETED)
+
+    expected = ducc0.wgridder.ms2dirty(uvw, freq, vis, weight_spectrum,
+        npix_x=64, npix_y=64, pixsize_x=1.0 / 64, pixsize_y=1.0 / 64,
+        epsilon=1e-6, do_wstacking=True)
+    assert np.allclose(drop_to_numpy(image_drop), expected, atol=1e-6 * np.abs(expected).max())
+
+
+@pytest.mark.parametrize("min_chunk_rows, num_calls", [(0, 2), (1, 6)])
+def test_StreamingMS2DirtyApp_min_chunk_rows(monkeypatch, min_chunk_rows, num_calls):
+    calls = []
+    ms2dirty = ducc0.wgridder.ms2dirty
+
+    def counting_ms2dirty(uvw, *args, **kwargs):
+        calls.append(len(uvw))
+        return ms2dirty(uvw, *args, **kwargs)
+
+    monkeypatch.setattr(ducc0.wgridder, "ms2dirty", counting_ms2dirty)
+    app = StreamingMS2DirtyApp("a", "a", npix_x=8, npix_y=8, min_chunk_rows=min_chunk_rows)
+
+    # 8x8 pixels over 3 channels grids every 22 rows by default
+    num_rows = 40
+    num_chan = 3
+    rng = np.random.default_rng(0)
+    uvw = rng.uniform(-4, 4, size=(num_rows, 3))
+    freq = np.linspace(299792458.0, 299792460.0, num_chan)
+    vis = rng.normal(size=(num_rows, num_chan)) + 1j * rng.normal(size=(num_rows, num_chan))
+    weight_spectrum = rng.uniform(size=(num_rows, num_chan))
+
+    arrays = [uvw, freq, vis, weight_spectrum]
+    drops = [InMemoryDROP(name, name) for name in ["uvw", "freq", "vis", "weight_spectrum"]]
+    for drop in drops:
+        app.addStreamingInput(drop)
+    image_drop = InMemoryDROP("image", "image")
+    app.addOutput(image_drop)
+    for drop, array in zip(drops, arrays):
+        write_npy_header(drop, array.shape, array.dtype)
+    write_npy_data(drops[1], freq)
+    for start in range(0, num_rows, 7):
+        for drop, array in zip(drops, arrays):
+            if array is not freq:
+                write_npy_data(drop, array[start:start + 7])
+    for drop in drops:
+        app.dropCompleted(drop.uid, DROPStates.COMPLETED)
+
+    assert len(calls) == num_calls
+    assert sum(calls) == num_rows
+    expected = ms2dirty(uvw, freq, vis, weight_spectrum,
+        npix_x=8, npix_y=8, pixsize_x=1.0 / 8, pixsize_y=1.0 / 8,
+        epsilon=1e-6, do_wstacking=True)
+    assert np.allclose(drop_to_numpy(image_drop), expected, atol=1e-6 * np.abs(expected).max())
+
+
+def _stream_ms2dirty(arrays):
+    app = StreamingMS2DirtyApp("a", "a")
+    drops = [InMemoryDROP(name, name) for name in ["uvw", "freq", "vis", "weight_spectrum"]]
+    for drop in drops:
+        app.addStreamingInput(drop)
+    image_drop = InMemoryDROP("image", "image")
+    app.addOutput(image_drop)
+    for drop, array in zip(drops, arrays):
+        write_npy_header(drop, array.shape, array.dtype)
+    write_npy_data(drops[1], arrays[1])
+    for drop, array in zip(drops, arrays):
+        if drop is not drops[1]:
+            write_npy_data(drop, array)
+    for drop in drops:
+        app.dropCompleted(drop.uid, DROPStates.COMPLETED)
+    return app, image_drop
+
+
+def test_StreamingMS2DirtyApp_cube():
+    num_rows = 20
+    num_chan = 3
+    num_pol = 2
+    rng = np.random.default_rng(0)
+    uvw = rng.uniform(-32, 32, size=(num_rows, 3))
+    freq = np.linspace(299792458.0, 299792460.0, num_chan)
+    vis = rng.normal(size=(num_rows, num_chan, num_pol)) + 1j * rng.normal(size=(num_rows, num_chan, num_pol))
+    weight_spectrum = rng.uniform(size=(num_rows, num_chan, num_pol))
+
+    app, image_drop = _stream_ms2dirty([uvw, freq, vis, weight_spectrum])
+    assert app.execStatus == AppDROPStates.FINISHED
+    image = drop_to_numpy(image_drop)
+    assert image.shape == (num_pol, 64, 64)
+    for pol in range(num_pol):
+        expected = ducc0.wgridder.ms2dirty(uvw, freq, vis[..., pol], weight_spectrum[..., pol],
+            npix_x=64, npix_y=64, pixsize_x=1.0 / 64, pixsize_y=1.0 / 64,
+            epsilon=1e-6, do_wstacking=True)
+        assert np.allclose(image[pol], expected, atol=1e-6 * np.abs(expected).max())
+
+    # mismatched shapes fail this app without raising into the producer's write
+    app, image_drop = _stream_ms2dirty([uvw, freq, vis, weight_spectrum[..., :1].repeat(3, axis=2)])
+    assert app.execStatus == AppDROPStates.ERROR
+
+
+def test_ReduceImagesApp():
+    images = [np.full((4, 4), i, dtype=np.float64) for i in range(3)]
+    app = ReduceImagesApp("a", "a")
+    for i, image in enumerate(images):
+        app.addInput(_array_drop(str(i), image))
+    image_drop = InMemoryDROP("image", "image")
+    app.addOutput(image_drop)
+    app.run()
+    assert np.array_equal(drop_to_numpy(image_drop), np.full((4, 4), 3.0))
+
+    app = ReduceImagesApp("b", "b")
+    app.addInput(_array_drop("x", np.zeros((4, 4))))
+    app.addInput(_array_drop("y", np.zeros((2, 2))))
+    with pytest.raises(DaliugeException):
+        app.run()
+
+
+def test_reduce_images_tree():
+    leaves = [InMemoryDROP(str(i), str(i)) for i in range(10)]
+    total = reduce_images_tree(leaves, fan_in=3)
+    with DROPWaiterCtx(unittest.TestCase(), total, timeout=10):
+        for i, leaf in enumerate(leaves):
+            numpy_to_drop(np.full((8, 8), i, dtype=np.float64), leaf)
+            leaf.setCompleted()
+    assert np.array_equal(drop_to_numpy(total), np.full((8, 8), 45.0))
+
+
+def test_ReduceImagesApp_fan_in():
+    app = ReduceImagesApp("a", "a", fan_in=2)
+    for i in range(3):
+        app.addInput(_array_drop(str(i), np.zeros((4, 4))))
+    app.addOutput(InMemoryDROP("image", "image"))
+    with pytest.raises(DaliugeException):
+        app.run()
+
+
+def test_reduce_images_tree_single_app():
+    leaves = [InMemoryDROP(str(i), str(i)) for i in range(5)]
+    total = reduce_images_tree(leaves)
+    assert len(total.producers) == 1
+    assert len(total.producers[0].inputs) == 5
+    with DROPWaiterCtx(unittest.TestCase(), total, timeout=10):
+        for i, leaf in enumerate(leaves):
+            numpy_to_drop(np.full((8, 8), i, dtype=np.float64), leaf)
+            leaf.setCompleted()
+    assert np.array_equal(drop_to_numpy(total), np.full((8, 8), 10.0))
+
+
 def test_CudaMS2DirtyApp_exceptions():
     app = CudaMS2DirtyApp("a", "a")
 
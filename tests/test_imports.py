@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# seconds to import the package and instantiate its apps on a node where
+# DALiuGE itself is already loaded
+IMPORT_TIME_BUDGET = 0.5
+
+HEAVY_MODULES = ["wagg", "ducc0", "casacore", "matplotlib"]
+
+SCRIPT = f"""
+import json, sys, time
+import dlg.drop
+start = time.perf_counter()
+import daliuge_component_nifty
+from daliuge_component_nifty import *
+import daliuge_component_nifty.ms, daliuge_component_nifty.plot
+for name in daliuge_component_nifty.__all__:
+    getattr(daliuge_component_nifty, name)(name, name)
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def test_import_is_lazy():
+    result = json.loads(subprocess.check_output(
+        [sys.executable, "-c", SCRIPT], cwd=os.path.dirname(os.path.dirname(__file__))))
+    assert result["loaded"] == []
+    assert result["seconds"] < IMPORT_TIME_BUDGET
+
+
+def test_unknown_attribute():
+    import daliuge_component_nifty
+    assert "MS2DirtyApp" in dir(daliuge_component_nifty)
+    with pytest.raises(AttributeError):
+        daliuge_component_nifty.NotAnApp
+
+
+UPDATE_SCRIPT = """
+import sys
+import numpy as np
+from dlg.drop import FileDROP, InMemoryDROP
+from daliuge_component_nifty.ms import MSCopyUpdateApp, MSUpdateApp, numpy_to_drop
+assert "casacore" not in sys.modules
+ms_path, out_path = sys.argv[1:]
+for app in [MSUpdateApp("a", "a"), MSCopyUpdateApp("b", "b")]:
+    app.addInput(FileDROP("ms", "ms", filepath=ms_path))
+    vis_drop = InMemoryDROP("vis", "vis")
+    numpy_to_drop(np.full((20, 4, 4), 3j), vis_drop)
+    app.addInput(vis_drop)
+    if isinstance(app, MSCopyUpdateApp):
+        app.addOutput(FileDROP("out", "out", filepath=out_path))
+    app.run()
+"""
+
+
+def test_update_apps_import_casacore(ms_path, tmpdir):
+    # casacore is only imported by the apps themselves
+    import casacore.tables
+    import numpy as np
+    out_path = str(tmpdir / "out.ms")
+    subprocess.check_call([sys.executable, "-c", UPDATE_SCRIPT, ms_path, out_path],
+                          cwd=os.path.dirname(os.path.dirname(__file__)))
+    for path in [ms_path, out_path]:
+        assert np.array_equal(casacore.tables.table(path, ack=False).getcol("DATA"), np.full((20, 4, 4), 3j))
@@ -1,14 +1,222 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+
 import pytest
 import numpy as np
+import casacore.tables
+import ducc0.wgridder
 
 from dlg.exceptions import DaliugeException
-from daliuge_component_nifty import MS2DirtyApp, CudaMS2DirtyApp, CudaDirty2MSApp
-from daliuge_component_nifty.ms import MSReadApp
-from dlg.drop import InMemoryDROP, FileDROP
+from daliuge_component_nifty import MS2DirtyApp, PrefetchMS2DirtyApp, CudaMS2DirtyApp, CudaDirty2MSApp
+from daliuge_component_nifty import ms, wire
+from daliuge_component_nifty.ms import MSCopyUpdateApp, MSReadApp, MSUpdateApp, release_shared_drop, write_column, drop_to_numpy, numpy_to_drop
+from dlg.ddap_protocol import AppDROPStates, DROPStates
+from dlg.drop import BarrierAppDROP, InMemoryDROP, FileDROP
 
 given = pytest.mark.parametrize
 
 
+@given("array", [
+    np.arange(12, dtype=np.float64).reshape(3, 4),
+    np.asfortranarray(np.arange(12, dtype=np.float64).reshape(3, 4)),
+    np.ones((4, 2, 2), dtype=np.complex128),
+    np.zeros((0, 3), dtype=np.float64),
+    np.array([True, False]),
+])
+def test_drop_to_numpy(array):
+    drop = InMemoryDROP("a", "a")
+    numpy_to_drop(array, drop)
+
+    view = drop_to_numpy(drop)
+    assert view.dtype == array.dtype
+    assert np.array_equal(view, array)
+    assert not view.flags.writeable
+
+    copy = drop_to_numpy(drop, writable=True)
+    assert copy.flags.writeable
+    copy[...] = 0
+    assert np.array_equal(drop_to_numpy(drop), array)
+
+
+def test_drop_to_numpy_delete():
+    # views don't stop the lifecycle from writing to or deleting the drop
+    drop = InMemoryDROP("a", "a")
+    numpy_to_drop(np.arange(4.0), drop)
+    view = drop_to_numpy(drop)
+    assert np.shares_memory(view, drop_to_numpy(drop))
+    drop.write(b"\0")
+    drop.setCompleted()
+    drop.getIO().delete()
+    assert not drop.exists()
+    assert np.array_equal(view, np.arange(4.0))
+
+
+@given("array", [
+    np.arange(24, dtype=np.float64).reshape(2, 3, 4),
+    np.asfortranarray(np.arange(24, dtype=np.float64).reshape(2, 3, 4)),
+    np.arange(60, dtype=np.complex128).reshape(5, 12)[:, ::2],
+    np.array(1 + 2j),
+])
+def test_numpy_to_drop(array):
+    drop = InMemoryDROP("a", "a")
+    numpy_to_drop(array, drop, chunk_size=7)
+
+    expected = io.BytesIO()
+    np.save(expected, array)
+    assert bytes(drop.getIO().buffer()) == expected.getvalue()
+
+
+def test_drop_to_numpy_file(tmpdir):
+    array = np.arange(24, dtype=np.complex128).reshape(2, 3, 4)
+    np.save(str(tmpdir / "a.npy"), array)
+    drop = FileDROP("a", "a", filepath="a.npy", dirname=str(tmpdir))
+
+    view = drop_to_numpy(drop)
+    assert isinstance(view, np.memmap)
+    assert np.array_equal(view, array)
+    assert not view.flags.writeable
+
+    copy = drop_to_numpy(drop, writable=True)
+    copy[...] = 0
+    assert np.array_equal(drop_to_numpy(drop), array)
+
+
+@given("codec, array", [
+    ("zlib", np.where(np.arange(60) % 3, 0, np.arange(60) + 1j).reshape(5, 3, 4)),
+    ("lzma", np.arange(24.0).reshape(4, 6).T),
+    ("bitpack", np.arange(101) % 7 == 0),
+    ("zlib", np.zeros((0, 4))),
+])
+def test_numpy_to_drop_codec(tmpdir, codec, array):
+    memory_drop = InMemoryDROP("a", "a")
+    file_drop = FileDROP("b", "b", filepath="b.npy", dirname=str(tmpdir))
+    for drop in [memory_drop, file_drop]:
+        numpy_to_drop(array, drop, chunk_size=16, codec=codec)
+        drop.setCompleted()
+        result = drop_to_numpy(drop)
+        assert result.dtype == array.dtype
+        assert np.array_equal(result, array)
+        assert not result.flags.writeable
+        assert drop_to_numpy(drop, writable=True).flags.writeable
+
+
+def test_numpy_to_drop_codec_exceptions():
+    with pytest.raises(DaliugeException):
+        numpy_to_drop(np.zeros(4), InMemoryDROP("a", "a"), codec="bitpack")
+    with pytest.raises(DaliugeException):
+        numpy_to_drop(np.zeros(4), InMemoryDROP("a", "a"), codec="snappy")
+
+
+
+def test_register_codec():
+    class EncodeOnly(wire.Codec):
+        def encode(self, array, chunk_size):
+            yield array.tobytes()
+
+    with pytest.raises(TypeError):
+        EncodeOnly()
+    with pytest.raises(DaliugeException):
+        wire.register_codec("encode_only", EncodeOnly)
+    with pytest.raises(DaliugeException):
+        wire.register_codec("raw", wire.ZlibCodec())
+    assert "encode_only" not in wire.CODECS
+
+def test_numpy_to_drop_shm(tmpdir):
+    array = np.arange(12.0).reshape(3, 4).T
+    for drop in [InMemoryDROP("a", "a"), FileDROP("b", "b", filepath="b.npy", dirname=str(tmpdir))]:
+        numpy_to_drop(array, drop, codec="shm")
+        drop.setCompleted()
+        assert drop.size < 200
+
+        view = drop_to_numpy(drop)
+        assert np.array_equal(view, array)
+        assert not view.flags.writeable
+        assert np.shares_memory(view, drop_to_numpy(drop))
+        assert not np.shares_memory(view, drop_to_numpy(drop, writable=True))
+
+        # another process maps the same segment
+        script = "import sys; from daliuge_component_nifty.ms import drop_to_numpy; " \
+                 "from dlg.drop import FileDROP; " \
+                 "print(drop_to_numpy(FileDROP('c', 'c', filepath=sys.argv[1])).sum())"
+        if isinstance(drop, FileDROP):
+            output = subprocess.check_output([sys.executable, "-c", script, drop.path],
+                                             cwd=os.path.dirname(os.path.dirname(__file__)))
+            assert float(output) == array.sum()
+
+        del view
+        release_shared_drop(drop)
+        with pytest.raises(DaliugeException):
+            drop_to_numpy(drop)
+
+
+def test_numpy_to_drop_shm_lifecycle():
+    # released once all consumers have finished
+    drop = InMemoryDROP("a", "a")
+    consumers = [BarrierAppDROP(uid, uid) for uid in ["c", "d"]]
+    for consumer in consumers:
+        drop.addConsumer(consumer)
+    numpy_to_drop(np.arange(4.0), drop, codec="shm")
+    consumers[0].execStatus = AppDROPStates.FINISHED
+    assert np.array_equal(drop_to_numpy(drop, writable=True), np.arange(4.0))
+    consumers[1].execStatus = AppDROPStates.ERROR
+    with pytest.raises(DaliugeException):
+        drop_to_numpy(drop)
+
+    # or once the drop expires
+    drop = InMemoryDROP("b", "b")
+    numpy_to_drop(np.arange(4.0), drop, codec="shm")
+    drop.setCompleted()
+    assert np.array_equal(drop_to_numpy(drop, writable=True), np.arange(4.0))
+    drop.status = DROPStates.EXPIRED
+    with pytest.raises(DaliugeException):
+        drop_to_numpy(drop)
+
+
+def test_numpy_to_drop_shm_consumer():
+    # a segment shared by another process, as seen by a consumer's process
+    array = np.arange(4.0)
+    shm, shared = ms.SharedArray.create(array)
+    try:
+        drop = InMemoryDROP("a", "a")
+        consumer = BarrierAppDROP("c", "c")
+        drop.addConsumer(consumer)
+        drop.write(wire.encode_header(wire.SHM, array, segment=shared.name))
+
+        assert np.array_equal(drop_to_numpy(drop, writable=True), array)
+        assert len(ms._shared_segments) == 0
+        view = drop_to_numpy(drop)
+        assert np.array_equal(view, array)
+        assert len(ms._shared_segments) == 1
+        consumer.execStatus = AppDROPStates.FINISHED
+        assert len(ms._shared_segments) == 0
+        # live views keep their mapping until they are gone
+        assert np.array_equal(view, array)
+        del view
+        ms._close_lingering()
+        assert len(ms._lingering_segments) == 0
+        # only unmapped, the producer still owns the segment
+        assert np.array_equal(drop_to_numpy(drop, writable=True), array)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_MSReadApp_port_codecs(ms_path):
+    expected = _read_ms(ms_path)
+    for port_codecs in ["zlib,flag=bitpack,uvw=raw", "shm"]:
+        encoded = _read_ms(ms_path, port_codecs=port_codecs)
+        for a, b in zip(expected, encoded):
+            assert np.array_equal(a, b)
+    with pytest.raises(DaliugeException):
+        _read_ms(ms_path, port_codecs="image=zlib")
+    for port_codecs in ["vis=bitpack", "bitpack"]:
+        with pytest.raises(DaliugeException, match="bitpack can.t encode port"):
+            _read_ms(ms_path, port_codecs=port_codecs)
+
+
 def test_MSReadApp_exceptions():
     app = MSReadApp("a", "a")
 
@@ -16,6 +224,390 @@ def test_MSReadApp_exceptions():
         app.run()
 
 
+def _read_ms(ms_path, num_outputs=6, **params):
+    app = MSReadApp("a", "a", **params)
+    ms_drop = FileDROP("ms", "ms", filepath=ms_path)
+    app.addInput(ms_drop)
+    outputs = [InMemoryDROP(str(i), str(i)) for i in range(num_outputs)]
+    for output in outputs:
+        app.addOutput(output)
+    app.run()
+    return [drop_to_numpy(output) for output in outputs]
+
+
+@given("taql_masking", [False, True])
+def test_MSReadApp_slicing(ms_path, taql_masking):
+    uvw, freq, vis, weight_spectrum, flag, weight = _read_ms(
+        ms_path, row_start=2, row_end=12, chan_start=1, chan_end=3, pol_start=3, pol_end=4,
+        taql_masking=taql_masking)
+
+    msm = casacore.tables.table(ms_path, ack=False)
+    rows = slice(2, 12)
+    flag_expected = msm.getcol("FLAG")[rows, 1:3, 3]
+    autocorr = (msm.getcol("ANTENNA1") == msm.getcol("ANTENNA2"))[rows, None]
+    assert np.array_equal(uvw, msm.getcol("UVW")[rows])
+    assert freq.shape == (2,)
+    assert np.array_equal(flag, flag_expected)
+    assert np.array_equal(vis, np.where(flag_expected | autocorr, 0, msm.getcol("DATA")[rows, 1:3, 3]))
+    assert np.array_equal(weight_spectrum, np.where(flag_expected, 0, msm.getcol("WEIGHT_SPECTRUM")[rows, 1:3, 3]))
+    assert np.array_equal(weight, msm.getcol("WEIGHT")[rows, 3])
+
+
+@given("taql_masking", [False, True])
+@given("selection", [dict(pol_end=-1), dict(pol_start=-1), dict(chan_start=-3, chan_end=-1), dict(pol_start=0, pol_end=4)])
+def test_MSReadApp_negative_slices(ms_path, taql_masking, selection):
+    uvw, freq, vis, weight_spectrum, flag, weight = _read_ms(ms_path, taql_masking=taql_masking, **selection)
+
+    msm = casacore.tables.table(ms_path, ack=False)
+    chans = slice(selection.get("chan_start", 0), selection.get("chan_end"))
+    pols = slice(selection.get("pol_start", 0), selection.get("pol_end"))
+    flag_expected = msm.getcol("FLAG")[:, chans, pols]
+    autocorr = (msm.getcol("ANTENNA1") == msm.getcol("ANTENNA2"))[:, None, None]
+    assert np.array_equal(flag, flag_expected.squeeze())
+    assert np.array_equal(vis, np.where(flag_expected | autocorr, 0, msm.getcol("DATA")[:, chans, pols]).squeeze())
+    assert np.array_equal(weight, msm.getcol("WEIGHT")[:, pols].squeeze())
+    assert np.array_equal(freq, _chan_freq(msm)[chans])
+
+
+def _chan_freq(msm):
+    return casacore.tables.table(msm.getkeyword("SPECTRAL_WINDOW"), ack=False).getcell("CHAN_FREQ", 0)
+
+
+@given("taql_masking", [False, True])
+@given("precision", ["double", "single"])
+def test_MSReadApp_empty_rows(ms_path, taql_masking, precision):
+    uvw, freq, vis, weight_spectrum, flag, weight = _read_ms(
+        ms_path, row_start=5, row_end=5, pol_end=2, taql_masking=taql_masking, precision=precision)
+    assert uvw.shape == (0, 3)
+    assert freq.shape == (4,)
+    assert vis.shape == weight_spectrum.shape == flag.shape == (0, 4, 2)
+    assert weight.shape == (0, 2)
+
+
+def test_read_column_step(ms_path):
+    msm = casacore.tables.table(ms_path, ack=False)
+    expected = msm.getcol("DATA")[3:9, 1:, 0::3]
+    for name in ["DATA", "DATA{cells}"]:
+        for dtype in [None, np.complex128]:
+            data = ms.read_column(msm, name, (3, 6), (slice(1, None), slice(0, None, 3)), dtype)
+            assert np.array_equal(data, expected)
+
+
+@given("taql_masking", [False, True])
+def test_MSReadApp_chunk_rows(ms_path, taql_masking):
+    expected = _read_ms(ms_path, row_start=1, pol_end=2, taql_masking=taql_masking)
+    chunked = _read_ms(ms_path, row_start=1, pol_end=2, taql_masking=taql_masking, chunk_rows=3)
+    for a, b in zip(expected, chunked):
+        assert a.dtype == b.dtype
+        assert np.array_equal(a, b)
+
+
+@given("taql_masking", [False, True])
+def test_MSReadApp_compact_rows(ms_path, monkeypatch, taql_masking):
+    expected = _read_ms(ms_path, pol_end=1, taql_masking=taql_masking)
+    names = []
+    def read_column(table, name, *args, **kwargs):
+        names.append(name)
+        return ms_read_column(table, name, *args, **kwargs)
+    ms_read_column = ms.read_column
+    monkeypatch.setattr(ms, "read_column", read_column)
+    compacted = _read_ms(ms_path, pol_end=1, compact_rows=True, taql_masking=taql_masking)
+    # keep is computed from the weight_spectrum port's read
+    assert sum("WEIGHT_SPECTRUM" in name for name in names) == 1
+
+    uvw, freq, vis, weight_spectrum, flag, weight = expected
+    keep = np.any((weight_spectrum != 0) & (vis != 0), axis=1)
+    assert not keep.all()
+    assert np.array_equal(compacted[1], freq)
+    for a, b in zip([uvw, vis, weight_spectrum, flag, weight], compacted[:1] + compacted[2:]):
+        assert np.array_equal(a[keep], b)
+
+
+@given("taql_masking", [False, True])
+def test_MSReadApp_stokes(ms_path, monkeypatch, taql_masking):
+    pols = []
+    def read_column(table, name, rows, cells, *args, **kwargs):
+        if len(cells) == 2:
+            pols.append(list(range(*cells[1].indices(4))))
+        return ms_read_column(table, name, rows, cells, *args, **kwargs)
+    ms_read_column = ms.read_column
+    monkeypatch.setattr(ms, "read_column", read_column)
+    uvw, freq, vis, weight_spectrum, flag, weight = _read_ms(
+        ms_path, row_end=12, chan_start=1, stokes="I", taql_masking=taql_masking)
+    # only the parallel hands are read
+    assert pols and all(p == [0, 3] for p in pols)
+
+    msm = casacore.tables.table(ms_path, ack=False)
+    rows = slice(0, 12)
+    flag_xx, flag_yy = (msm.getcol("FLAG")[rows, 1:, p] for p in (0, 3))
+    autocorr = (msm.getcol("ANTENNA1") == msm.getcol("ANTENNA2"))[rows, None]
+    data = msm.getcol("DATA")[rows, 1:]
+    wa, wb = (np.where(f, 0, msm.getcol("WEIGHT_SPECTRUM")[rows, 1:, p]) for f, p in ((flag_xx, 0), (flag_yy, 3)))
+    assert vis.shape == weight_spectrum.shape == flag.shape == (12, 3)
+    assert np.array_equal(flag, flag_xx | flag_yy)
+    assert np.allclose(vis, np.where(flag | autocorr, 0, (data[..., 0] + data[..., 3]) / 2))
+    with np.errstate(invalid="ignore"):
+        assert np.allclose(weight_spectrum, np.nan_to_num(4 * wa * wb / (wa + wb)))
+    wa, wb = msm.getcol("WEIGHT")[rows, 0], msm.getcol("WEIGHT")[rows, 3]
+    assert np.allclose(weight, 4 * wa * wb / (wa + wb))
+
+    chunked = _read_ms(ms_path, row_end=12, chan_start=1, stokes="I", taql_masking=taql_masking, chunk_rows=5)
+    for a, b in zip([uvw, freq, vis, weight_spectrum, flag, weight], chunked):
+        assert np.array_equal(a, b)
+
+    with pytest.raises(DaliugeException):
+        _read_ms(ms_path, stokes="Q")
+
+
+@given("params", [{}, {"taql_masking": True}, {"chunk_rows": 7}, {"stokes": "I"}])
+def test_MSReadApp_precision(ms_path, params):
+    expected = _read_ms(ms_path, **params)
+    single = _read_ms(ms_path, precision="single", **params)
+    dtypes = [np.float64, np.float64, np.complex64, np.float32, np.bool_, np.float32]
+    for a, b, dtype in zip(expected, single, dtypes):
+        assert b.dtype == dtype
+        assert np.allclose(a, b, rtol=1e-6)
+
+
+def test_read_column_dtype(ms_path):
+    msm = casacore.tables.table(ms_path, ack=False)
+    cells = (slice(1, 3), slice(0, 4, 3))
+    data = ms.read_column(msm, "DATA", (2, 5), cells, np.complex64)
+    assert data.dtype == np.complex64
+    assert np.allclose(data, msm.getcol("DATA")[2:7, 1:3, ::3])
+    uvw = ms.read_column(msm, "UVW", (0, -1), (), np.float64)
+    assert np.array_equal(uvw, msm.getcol("UVW"))
+    assert ms.read_column(msm, "UVW", (20, 0), (), np.float64).shape == (0, 3)
+
+
+def test_MSReadApp_metrics(ms_path):
+    from daliuge_component_nifty.metrics import set_metrics_sink
+    records = []
+    set_metrics_sink(records.append)
+    try:
+        outputs = _read_ms(ms_path, chunk_rows=8)
+    finally:
+        set_metrics_sink(None)
+
+    record, = records
+    assert set(record["phases"]) == {"open"} | {f"read_{name}" for name in MSReadApp.PORT_NAMES if name != "freq"}
+    assert record["bytes_written"] == sum(output.nbytes for output in outputs)
+
+
+@given("params", [{}, {"taql_masking": True}, {"compact_rows": True, "pol_end": 2}, {"stokes": "I"}])
+@given("daemon", [False, True])
+def test_MSReadApp_read_workers(ms_path, monkeypatch, params, daemon):
+    expected = _read_ms(ms_path, row_start=2, chan_start=1, **params)
+    # daemonic processes read in threads
+    monkeypatch.setattr(ms.multiprocessing, "current_process", lambda: type("Process", (), {"daemon": daemon}))
+    outputs = _read_ms(ms_path, row_start=2, chan_start=1, read_workers=3, **params)
+    for a, b in zip(expected, outputs):
+        assert a.dtype == b.dtype
+        assert np.array_equal(a, b)
+    assert len(_read_ms(ms_path, num_outputs=2, read_workers=3)) == 2
+
+
+def test_pool_executor(monkeypatch):
+    # the calling process is never forked
+    with ms.pool_executor(2) as pool:
+        assert isinstance(pool, ms.ProcessPoolExecutor)
+        assert pool._mp_context.get_start_method() in ms.POOL_START_METHODS
+        assert pool.submit(abs, -1).result() == 1
+
+    def get_context(method):
+        raise ValueError(method)
+    monkeypatch.setattr(ms.multiprocessing, "get_context", get_context)
+    with ms.pool_executor(2) as pool:
+        assert isinstance(pool, ms.ThreadPoolExecutor)
+
+
+@given("params", [{"pol": 3}, {"pol": -1, "chan_start": -3}, {"stokes": "I", "chan_start": 1}, {"pol": 0, "row_start": 2, "row_end": 17, "precision": "single"}])
+@given("block_rows, prefetch_blocks", [(100, 1), (3, 1), (4, 3)])
+def test_PrefetchMS2DirtyApp(ms_path, params, block_rows, prefetch_blocks):
+    read_params = {key: value for key, value in params.items() if key != "precision"}
+    if "pol" in read_params:
+        pol = read_params.pop("pol")
+        read_params.update(pol_start=pol, pol_end=pol + 1 or None)
+    uvw, freq, vis, weight_spectrum = _read_ms(ms_path, num_outputs=4, **read_params)
+    app = MS2DirtyApp("a", "a", precision=params.get("precision", "double"))
+    for name, array in zip(["uvw", "freq", "vis", "weight_spectrum"], [uvw, freq, vis, weight_spectrum]):
+        drop = InMemoryDROP(name, name)
+        numpy_to_drop(array, drop)
+        app.addInput(drop)
+    expected_drop = InMemoryDROP("image", "image")
+    app.addOutput(expected_drop)
+    app.run()
+    expected = drop_to_numpy(expected_drop)
+
+    app = PrefetchMS2DirtyApp("b", "b", block_rows=block_rows, prefetch_blocks=prefetch_blocks, **params)
+    app.addInput(FileDROP("ms", "ms", filepath=ms_path))
+    image_drop = InMemoryDROP("image", "image")
+    app.addOutput(image_drop)
+    app.run()
+    image = drop_to_numpy(image_drop)
+    assert image.dtype == expected.dtype
+    assert np.allclose(image, expected, atol=1e-4 * np.abs(expected).max())
+
+
+def test_PrefetchMS2DirtyApp_exceptions(ms_path, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("read failed")
+    monkeypatch.setattr(PrefetchMS2DirtyApp, "readBlock", staticmethod(fail))
+    app = PrefetchMS2DirtyApp("a", "a", block_rows=3)
+    app.addInput(FileDROP("ms", "ms", filepath=ms_path))
+    app.addOutput(InMemoryDROP("image", "image"))
+    with pytest.raises(RuntimeError):
+        app.run()
+
+
+def test_PrefetchMS2DirtyApp_grid_error(ms_path, monkeypatch):
+    tables = []
+    read_block = PrefetchMS2DirtyApp.readBlock
+    def readBlock(msm, cells, rows, block):
+        tables.append(msm)
+        read_block(msm, cells, rows, block)
+    monkeypatch.setattr(PrefetchMS2DirtyApp, "readBlock", staticmethod(readBlock))
+    calls = []
+    def ms2dirty(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise RuntimeError("grid failed")
+        return np.zeros((kwargs["npix_x"], kwargs["npix_y"]))
+    monkeypatch.setattr(ducc0.wgridder, "ms2dirty", ms2dirty)
+
+    app = PrefetchMS2DirtyApp("a", "a", block_rows=3, prefetch_blocks=2)
+    app.addInput(FileDROP("ms", "ms", filepath=ms_path))
+    app.addOutput(InMemoryDROP("image", "image"))
+    with pytest.raises(RuntimeError):
+        app.run()
+    # the reader thread has stopped and the table is closed
+    assert not [thread for thread in threading.enumerate() if thread.name == "prefetch"]
+    with pytest.raises(RuntimeError):
+        tables[0].nrows()
+
+
+def test_MSReadApp_cache(ms_path, tmpdir, monkeypatch):
+    cache_dir = str(tmpdir / "cache")
+    expected = _read_ms(ms_path, row_end=12, pol_end=2, compact_rows=True)
+    outputs = _read_ms(ms_path, row_end=12, pol_end=2, compact_rows=True, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 6
+
+    # served without opening the measurement set, whatever the codecs and workers
+    table = casacore.tables.table
+    monkeypatch.setattr(casacore.tables, "table", None)
+    cached = _read_ms(ms_path, row_end=12, pol_end=2, compact_rows=True, cache_dir=cache_dir, port_codecs="zlib",
+                      read_workers=2)
+    for a, b, c in zip(expected, outputs, cached):
+        assert a.dtype == b.dtype == c.dtype
+        assert np.array_equal(a, b)
+        assert np.array_equal(a, c)
+    monkeypatch.setattr(casacore.tables, "table", table)
+
+    # a different selection or a modified measurement set misses
+    _read_ms(ms_path, row_end=12, pol_end=1, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 12
+    msm = casacore.tables.table(ms_path, readonly=False, ack=False)
+    msm.putcol("UVW", np.zeros((20, 3)))
+    msm.close()
+    uvw = _read_ms(ms_path, num_outputs=1, row_end=12, pol_end=1, cache_dir=cache_dir)[0]
+    assert not uvw.any()
+    assert len(os.listdir(cache_dir)) == 13
+
+
+@given("copy_mode", ["copy", "reflink", "hardlink"])
+def test_MSCopyUpdateApp(ms_path, tmpdir, copy_mode):
+    msm = casacore.tables.table(ms_path, ack=False)
+    data = msm.getcol("DATA")
+    vis = np.full(data.shape, 2 + 1j)
+
+    app = MSCopyUpdateApp("a", "a", copy_mode=copy_mode, copy_threads=3)
+    app.addInput(FileDROP("ms", "ms", filepath=ms_path))
+    vis_drop = InMemoryDROP("vis", "vis")
+    numpy_to_drop(vis, vis_drop)
+    app.addInput(vis_drop)
+    output_paths = [str(tmpdir / f"out{i}.ms") for i in range(2)]
+    for i, path in enumerate(output_paths):
+        app.addOutput(FileDROP(f"out{i}", f"out{i}", filepath=path))
+    app.run()
+
+    assert np.array_equal(casacore.tables.table(ms_path, ack=False).getcol("DATA"), data)
+    for path in output_paths:
+        out = casacore.tables.table(path, ack=False)
+        assert np.array_equal(out.getcol("DATA"), vis)
+        assert np.array_equal(out.getcol("UVW"), msm.getcol("UVW"))
+        assert casacore.tables.table(out.getkeyword("SPECTRAL_WINDOW"), ack=False).nrows() == 1
+        linked = os.stat(os.path.join(path, "SPECTRAL_WINDOW", "table.f0")).st_nlink > 1
+        assert linked == (copy_mode == "hardlink")
+        assert os.stat(os.path.join(path, "table.lock")).st_nlink == 1
+
+
+@given("copy_mode", ["copy", "reflink", "hardlink"])
+def test_MSCopyUpdateApp_rerun(ms_path, tmpdir, copy_mode):
+    expected = {name: os.path.getsize(os.path.join(root, name))
+                for root, _, files in os.walk(ms_path) for name in files if name != "table.lock"}
+    output_path = str(tmpdir / "out.ms")
+    for _ in range(2):
+        app = MSCopyUpdateApp("a", "a", copy_mode=copy_mode)
+        app.addInput(FileDROP("ms", "ms", filepath=ms_path))
+        vis_drop = InMemoryDROP("vis", "vis")
+        numpy_to_drop(np.full((20, 4, 4), 2 + 1j), vis_drop)
+        app.addInput(vis_drop)
+        app.addOutput(FileDROP("out", "out", filepath=output_path))
+        app.run()
+
+    # a second run over the hard links of the first must not touch the source
+    assert {name: os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(ms_path) for name in files if name != "table.lock"} == expected
+    msm = casacore.tables.table(ms_path, ack=False)
+    for subtable in ["ANTENNA", "SPECTRAL_WINDOW", "POLARIZATION"]:
+        assert casacore.tables.table(msm.getkeyword(subtable), ack=False).nrows() == \
+            casacore.tables.table(os.path.join(output_path, subtable), ack=False).nrows()
+    assert np.array_equal(casacore.tables.table(output_path, ack=False).getcol("DATA"), np.full((20, 4, 4), 2 + 1j))
+
+    with pytest.raises(DaliugeException):
+        ms.copy_table(ms_path, ms_path, copy_mode, None)
+
+
+class _TiledColumn:
+    """
+    Records the putcol calls a column with 4 rows per tile receives.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def getdminfo(self, name):
+        return {"SPEC": {"HYPERCUBES": {"*1": {"TileShape": np.array([4, 2, 4])}}}}
+
+    def putcol(self, name, value, startrow, nrow):
+        assert len(value) == nrow
+        self.calls.append((startrow, nrow))
+
+
+def test_write_column(ms_path, monkeypatch):
+    msm = casacore.tables.table(ms_path, readonly=False, ack=False)
+    data = np.arange(18 * 4 * 4).reshape(18, 4, 4) * (1 + 1j)
+    write_column(msm, "DATA", data, startrow=2, chunk_rows=5)
+    assert np.array_equal(msm.getcol("DATA", startrow=2, nrow=18), data)
+
+    # blocks of 8 rows of 16 bytes, ending on tile boundaries
+    monkeypatch.setattr(ms, "IO_CHUNK_SIZE", 8 * 16)
+    table = _TiledColumn()
+    write_column(table, "DATA", np.zeros((20, 1), np.complex128), startrow=3)
+    assert table.calls == [(3, 5), (8, 8), (16, 7)]
+
+
+def test_MSUpdateApp(ms_path):
+    vis = np.full((20, 4, 4), 3j)
+    app = MSUpdateApp("a", "a", chunk_rows=6)
+    app.addInput(FileDROP("ms", "ms", filepath=ms_path))
+    vis_drop = FileDROP("vis", "vis", filepath=ms_path + ".npy")
+    numpy_to_drop(vis, vis_drop)
+    vis_drop.setCompleted()
+    app.addInput(vis_drop)
+    app.run()
+    assert np.array_equal(casacore.tables.table(ms_path, ack=False).getcol("DATA"), vis)
+
+
 def test_MSReadApp():
     app = MSReadApp("a", "a")
     